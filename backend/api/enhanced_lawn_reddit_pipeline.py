@@ -3,18 +3,31 @@ enhanced_lawn_reddit_pipeline.py
 Comprehensive Reddit -> SQLite -> OpenAI analysis pipeline for lawn issues.
 Includes comment analysis and expanded problem categories.
 """
-import argparse, os, time, sqlite3, json, re, sys
+import abc, argparse, copy, os, time, sqlite3, json, random, re, socket, sys, threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import List, Dict, Any, Optional, Tuple
 
 import requests
 from dotenv import load_dotenv
-from PIL import Image
+from PIL import Image, ImageOps
 
 import praw
+from praw.models import MoreComments
 from openai import OpenAI
 
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # ---------- Console-safe icons (avoid UnicodeEncodeError on Windows) ----------
 def safe_icon(s: str) -> str:
     try:
@@ -43,6 +56,9 @@ DATA_DIR = Path("datasets/reddit_lawns")
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 DB_PATH.parent.mkdir(parents=True, exist_ok=True)
 
+# Pause between search terms to stay under Reddit's rate limit
+SEARCH_DELAY_SECONDS = 1.5
+
 # ---------- Utilities ----------
 def utc_now_iso() -> str:
     return datetime.now(timezone.utc).isoformat(timespec="seconds")
@@ -99,7 +115,16 @@ ALL_KEYWORDS: List[str] = []
 for category_keywords in TARGET_KEYWORDS.values():
     ALL_KEYWORDS.extend(category_keywords)
 
+# Terms searched in every subreddit by collect
+COLLECT_SEARCH_TERMS: List[str] = ALL_KEYWORDS[:30]
+
 # ---------- DB ----------
+def ensure_column(cur: sqlite3.Cursor, table: str, column: str, decl: str):
+    """Add a column to a table created by an older version of the pipeline."""
+    cur.execute(f"PRAGMA table_info({table})")
+    if column not in {row[1] for row in cur.fetchall()}:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
 def init_enhanced_db():
     """Initialize enhanced database with comment analysis support"""
     con = sqlite3.connect(DB_PATH)
@@ -140,9 +165,11 @@ def init_enhanced_db():
         has_product_mention BOOLEAN DEFAULT 0,
         confidence_score REAL DEFAULT 0.0,
         comment_type TEXT,
+        depth INTEGER DEFAULT 0,
         FOREIGN KEY (post_id) REFERENCES posts (id)
     )
     """)
+    ensure_column(cur, "comments", "depth", "INTEGER DEFAULT 0")
 
     cur.execute("""    CREATE TABLE IF NOT EXISTS analyses (
         post_id TEXT PRIMARY KEY,
@@ -161,15 +188,339 @@ def init_enhanced_db():
     )
     """)
 
+    cur.execute("""    CREATE TABLE IF NOT EXISTS compression_dicts (
+        dict_id INTEGER PRIMARY KEY,
+        kind TEXT,
+        dict_data BLOB,
+        trained_at TEXT,
+        active BOOLEAN DEFAULT 1
+    )
+    """)
+
+    cur.execute("""    CREATE TABLE IF NOT EXISTS analysis_queue (
+        post_id TEXT PRIMARY KEY,
+        priority REAL DEFAULT 0.0,
+        status TEXT DEFAULT 'pending',
+        comment_count INTEGER DEFAULT 0,
+        solution_comments INTEGER DEFAULT 0,
+        diagnostic_comments INTEGER DEFAULT 0,
+        lease_owner TEXT,
+        lease_expires REAL,
+        attempts INTEGER DEFAULT 0,
+        enqueued_at TEXT,
+        updated_at TEXT,
+        FOREIGN KEY (post_id) REFERENCES posts (id)
+    )
+    """)
+    cur.execute("""    CREATE TABLE IF NOT EXISTS image_features (
+        post_id TEXT PRIMARY KEY,
+        source_path TEXT,
+        derivative_path TEXT,
+        thumbnail_path TEXT,
+        width INTEGER,
+        height INTEGER,
+        green_ratio REAL,
+        brown_yellow_ratio REAL,
+        mean_saturation REAL,
+        mean_brightness REAL,
+        error TEXT,
+        processed_at TEXT,
+        FOREIGN KEY (post_id) REFERENCES posts (id)
+    )
+    """)
+
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_analysis_queue_claim ON analysis_queue (status, priority DESC)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_comments_post ON comments (post_id)")
+
+    # Databases from before the queue existed: enqueue every post once
+    if cur.execute("SELECT 1 FROM analysis_queue LIMIT 1").fetchone() is None and \
+       cur.execute("SELECT 1 FROM posts LIMIT 1").fetchone() is not None:
+        backfill_analysis_queue(con)
+
+    con.commit()
+    con.close()
+
+# ---------- Analysis queue ----------
+QUEUE_STATUSES = ("pending", "leased", "done", "failed")
+ANALYSIS_LEASE_SECONDS = 600
+ANALYSIS_MAX_ATTEMPTS = 3
+_PRIORITY_CAP = 999_999
+
+def queue_priority(solution_comments: int, diagnostic_comments: int, score: int, comment_count: int) -> float:
+    """Single sortable key equivalent to ORDER BY signal comments, score, comment count (all DESC)."""
+    signals = (solution_comments or 0) + (diagnostic_comments or 0)
+    score = min(max(score or 0, 0), _PRIORITY_CAP)
+    comment_count = min(max(comment_count or 0, 0), _PRIORITY_CAP)
+    return float(signals * 1e12 + score * 1e6 + comment_count)
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def enqueue_for_analysis(cur: sqlite3.Cursor, post_id: str):
+    """Insert or refresh a post's queue entry from its stored comments and score.
+
+    Status is left alone on refresh, so analyzed posts are not re-queued.
+    """
+    cur.execute("""        SELECT COUNT(*), COALESCE(SUM(is_solution), 0), COALESCE(SUM(is_diagnostic), 0)
+        FROM comments WHERE post_id = ?
+    """, (post_id,))
+    comment_count, solution_count, diagnostic_count = cur.fetchone()
+    cur.execute("SELECT score FROM posts WHERE id = ?", (post_id,))
+    row = cur.fetchone()
+    score = row[0] if row else 0
+    now = utc_now_iso()
+    cur.execute("""        INSERT INTO analysis_queue
+        (post_id, priority, status, comment_count, solution_comments, diagnostic_comments, enqueued_at, updated_at)
+        VALUES (?, ?, 'pending', ?, ?, ?, ?, ?)
+        ON CONFLICT(post_id) DO UPDATE SET
+            priority = excluded.priority,
+            comment_count = excluded.comment_count,
+            solution_comments = excluded.solution_comments,
+            diagnostic_comments = excluded.diagnostic_comments,
+            updated_at = excluded.updated_at
+    """, (post_id, queue_priority(solution_count, diagnostic_count, score, comment_count),
+          comment_count, solution_count, diagnostic_count, now, now))
+
+def backfill_analysis_queue(con: sqlite3.Connection):
+    """Queue every post not yet in analysis_queue; already-analyzed posts go in as done."""
+    con.create_function("queue_priority", 4, queue_priority)
+    now = utc_now_iso()
+    con.execute("""        INSERT OR IGNORE INTO analysis_queue
+        (post_id, priority, status, comment_count, solution_comments, diagnostic_comments, enqueued_at, updated_at)
+        SELECT p.id,
+               queue_priority(SUM(CASE WHEN c.is_solution = 1 THEN 1 ELSE 0 END),
+                              SUM(CASE WHEN c.is_diagnostic = 1 THEN 1 ELSE 0 END),
+                              p.score, COUNT(c.id)),
+               CASE WHEN a.post_id IS NULL THEN 'pending' ELSE 'done' END,
+               COUNT(c.id),
+               SUM(CASE WHEN c.is_solution = 1 THEN 1 ELSE 0 END),
+               SUM(CASE WHEN c.is_diagnostic = 1 THEN 1 ELSE 0 END),
+               ?, ?
+        FROM posts p
+        LEFT JOIN comments c ON c.post_id = p.id
+        LEFT JOIN analyses a ON a.post_id = p.id
+        GROUP BY p.id
+    """, (now, now))
+
+def claim_analysis_batch(con: sqlite3.Connection, worker_id: str, limit: int,
+                         lease_seconds: int = ANALYSIS_LEASE_SECONDS) -> List[str]:
+    """Lease up to `limit` highest-priority pending posts to `worker_id`.
+
+    Expired leases return to pending first. BEGIN IMMEDIATE serializes
+    claimers across processes so no post is handed out twice.
+    """
+    now = time.time()
     con.commit()
+    cur = con.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        cur.execute("""            UPDATE analysis_queue SET status = 'pending', lease_owner = NULL, lease_expires = NULL
+            WHERE status = 'leased' AND lease_expires < ?
+        """, (now,))
+        cur.execute("SELECT post_id FROM analysis_queue WHERE status = 'pending' ORDER BY priority DESC LIMIT ?", (limit,))
+        post_ids = [r[0] for r in cur.fetchall()]
+        cur.executemany("""            UPDATE analysis_queue
+            SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ?
+            WHERE post_id = ?
+        """, [(worker_id, now + lease_seconds, utc_now_iso(), pid) for pid in post_ids])
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    return post_ids
+
+def complete_analysis(cur: sqlite3.Cursor, post_id: str):
+    cur.execute("""        UPDATE analysis_queue SET status = 'done', lease_owner = NULL, lease_expires = NULL, updated_at = ?
+        WHERE post_id = ?
+    """, (utc_now_iso(), post_id))
+
+def release_analysis(cur: sqlite3.Cursor, post_id: str):
+    """Return a failed post to the queue, or park it as failed after ANALYSIS_MAX_ATTEMPTS."""
+    cur.execute("""        UPDATE analysis_queue
+        SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+            lease_owner = NULL, lease_expires = NULL, updated_at = ?
+        WHERE post_id = ?
+    """, (ANALYSIS_MAX_ATTEMPTS, utc_now_iso(), post_id))
+
+def requeue_for_escalation(con: sqlite3.Connection, model: str, limit: int) -> int:
+    """Return up to `limit` done posts whose analysis by `model` is below high confidence to pending.
+
+    One UPDATE, so concurrent escalating analyzers requeue each post once and then
+    share it through claim_analysis_batch like any other pending work.
+    """
+    cur = con.execute("""        UPDATE analysis_queue SET status = 'pending', attempts = 0, updated_at = ?
+        WHERE status = 'done' AND post_id IN (
+            SELECT a.post_id FROM analyses a JOIN analysis_queue q ON q.post_id = a.post_id
+            WHERE q.status = 'done' AND a.model = ? AND a.confidence != 'high' LIMIT ?
+        )
+    """, (utc_now_iso(), model, limit))
+    con.commit()
+    return cur.rowcount
+
+def print_queue_status():
+    init_enhanced_db()
+    con = sqlite3.connect(DB_PATH)
+    counts = dict(con.execute("SELECT status, COUNT(*) FROM analysis_queue GROUP BY status").fetchall())
     con.close()
+    print(f"{CHART} Analysis queue: " + ", ".join(f"{s} {counts.get(s, 0)}" for s in QUEUE_STATUSES))
+
+# ---------- Compressed storage ----------
+COMPRESSION_LEVEL = 9
+COMPRESSED_KINDS = ("comment_body", "reasoning_json")
+# analyses columns that reasoning_json repeats verbatim
+REASONING_SPLIT_FIELDS = ("root_cause", "confidence", "categories", "solutions",
+                          "weed_percentage", "health_score", "treatment_urgency")
+
+class TextCodec:
+    """zstd dictionary codec for comment bodies and raw model JSON.
+
+    Compressed values are stored as BLOBs and plain TEXT passes through untouched,
+    so both can coexist in a table. With no active dictionary encode() is a no-op.
+    """
+    def __init__(self, dicts: List[Tuple[int, str, bytes, bool]]):
+        self._compressors: Dict[str, Any] = {}
+        self._decompressors: Dict[int, Any] = {}
+        for dict_id, kind, data, active in dicts:
+            zdict = zstd.ZstdCompressionDict(data)
+            self._decompressors[dict_id] = zstd.ZstdDecompressor(dict_data=zdict)
+            if active:
+                self._compressors[kind] = zstd.ZstdCompressor(level=COMPRESSION_LEVEL, dict_data=zdict)
+
+    def compresses(self, kind: str) -> bool:
+        return kind in self._compressors
+
+    def encode(self, kind: str, text: str) -> Any:
+        compressor = self._compressors.get(kind)
+        if compressor is None or not text:
+            return text
+        return compressor.compress(text.encode("utf-8"))
+
+    def decode(self, value: Any) -> Any:
+        if not isinstance(value, bytes):
+            return value
+        dict_id = zstd.get_frame_parameters(value).dict_id
+        decompressor = self._decompressors.get(dict_id)
+        if decompressor is None:
+            raise ValueError(f"No compression dictionary {dict_id} in database")
+        return decompressor.decompress(value).decode("utf-8")
+
+def load_codec(cur: sqlite3.Cursor) -> TextCodec:
+    """Load every stored dictionary (inactive ones are kept for decoding older rows)."""
+    cur.execute("SELECT dict_id, kind, dict_data, active FROM compression_dicts")
+    dicts = [(r[0], r[1], r[2], bool(r[3])) for r in cur.fetchall()]
+    if dicts and zstd is None:
+        print("This database uses compressed storage. Install zstandard (pip install zstandard).")
+        sys.exit(1)
+    return TextCodec(dicts)
+
+def analysis_columns(root_cause: Any, confidence: Any, categories_json: Any, solutions_json: Any,
+                     weed_percentage: Any, health_score: Any, treatment_urgency: Any) -> Dict[str, Any]:
+    """Values of the split analyses columns, keyed like the model output."""
+    return {
+        "root_cause": root_cause,
+        "confidence": confidence,
+        "categories": json.loads(categories_json) if categories_json else [],
+        "solutions": json.loads(solutions_json) if solutions_json else [],
+        "weed_percentage": weed_percentage,
+        "health_score": health_score,
+        "treatment_urgency": treatment_urgency,
+    }
+
+def compact_reasoning(data: Any, columns: Dict[str, Any]) -> Any:
+    """Drop model-output fields that the split analyses columns reproduce exactly.
+
+    Values are compared as serialized JSON so e.g. an int 12 is not replaced by the
+    column's 12.0. The result is wrapped as {"_compact": rest, "_from_columns":
+    {key: position in data}} so it cannot be confused with the model's own keys.
+    """
+    if not isinstance(data, dict):
+        return data
+    dropped = {k: i for i, k in enumerate(data)
+               if k in REASONING_SPLIT_FIELDS and safe_str(data[k]) == safe_str(columns.get(k))
+               and type(data[k]) is type(columns.get(k))}
+    if not dropped:
+        return data
+    return {"_compact": {k: v for k, v in data.items() if k not in dropped}, "_from_columns": dropped}
+
+def store_reasoning(codec: TextCodec, data: Any, columns: Dict[str, Any]) -> Any:
+    """Serialize raw model output; compressed rows keep only what the columns lack.
+
+    Every stored value is checked to load back identically: the compact form falls
+    back to the full output, and output that itself looks like a compact row is
+    wrapped with an empty restore map.
+    """
+    text = safe_str(data)
+    if codec.compresses("reasoning_json"):
+        compact = codec.encode("reasoning_json", safe_str(compact_reasoning(data, columns)))
+        if load_reasoning(codec, compact, columns) == text:
+            return compact
+    stored = codec.encode("reasoning_json", text)
+    if load_reasoning(codec, stored, columns) != text:
+        stored = codec.encode("reasoning_json", safe_str({"_compact": data, "_from_columns": {}}))
+    return stored
+
+def load_reasoning(codec: TextCodec, stored: Any, columns: Dict[str, Any]) -> str:
+    """Inverse of store_reasoning: decode and restore fields that were kept only in columns."""
+    text = codec.decode(stored) or ""
+    if '"_compact"' not in text:
+        return text
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return text
+    if not (isinstance(data, dict) and set(data) == {"_compact", "_from_columns"}
+            and isinstance(data["_from_columns"], dict)):
+        return text
+    body, dropped = data["_compact"], data["_from_columns"]
+    if not dropped:
+        return safe_str(body)
+    if not isinstance(body, dict):
+        return text
+    items = list(body.items())
+    for k, i in sorted(dropped.items(), key=lambda kv: kv[1]):
+        items.insert(i, (k, columns.get(k)))
+    return safe_str(dict(items))
 
 # ---------- Reddit ----------
-def connect_reddit():
-    """Connect to Reddit API"""
-    client_id     = os.getenv("REDDIT_CLIENT_ID")
-    client_secret = os.getenv("REDDIT_CLIENT_SECRET")
-    user_agent    = os.getenv("REDDIT_USER_AGENT", "enhanced_lawn_pipeline/2.0 by u/your_reddit_name")
+DEFAULT_USER_AGENT = "enhanced_lawn_pipeline/2.0 by u/your_reddit_name"
+
+def load_reddit_credentials() -> List[Dict[str, str]]:
+    """All configured credential sets: REDDIT_CLIENT_ID/SECRET, then REDDIT_CLIENT_ID_1/SECRET_1, _2, ...
+
+    A numbered set without its own secret is skipped rather than paired with another app's.
+    """
+    creds = []
+    if os.getenv("REDDIT_CLIENT_ID") and os.getenv("REDDIT_CLIENT_SECRET"):
+        creds.append({
+            "client_id": os.getenv("REDDIT_CLIENT_ID"),
+            "client_secret": os.getenv("REDDIT_CLIENT_SECRET"),
+            "user_agent": os.getenv("REDDIT_USER_AGENT", DEFAULT_USER_AGENT),
+        })
+    i = 1
+    while os.getenv(f"REDDIT_CLIENT_ID_{i}"):
+        if not os.getenv(f"REDDIT_CLIENT_SECRET_{i}"):
+            print(f"{SKIP} REDDIT_CLIENT_ID_{i} has no REDDIT_CLIENT_SECRET_{i}; skipping that credential set")
+        else:
+            creds.append({
+                "client_id": os.getenv(f"REDDIT_CLIENT_ID_{i}"),
+                "client_secret": os.getenv(f"REDDIT_CLIENT_SECRET_{i}"),
+                "user_agent": os.getenv(f"REDDIT_USER_AGENT_{i}", os.getenv("REDDIT_USER_AGENT", DEFAULT_USER_AGENT)),
+            })
+        i += 1
+    return creds
+
+def connect_reddit(credentials: Optional[Dict[str, str]] = None):
+    """Connect to Reddit API (with an explicit credential set, or the REDDIT_* environment)"""
+    if credentials is None:
+        credentials = {
+            "client_id": os.getenv("REDDIT_CLIENT_ID"),
+            "client_secret": os.getenv("REDDIT_CLIENT_SECRET"),
+            "user_agent": os.getenv("REDDIT_USER_AGENT", DEFAULT_USER_AGENT),
+        }
+    # An explicit set is used as a whole, never completed from the unnumbered environment
+    client_id     = credentials.get("client_id")
+    client_secret = credentials.get("client_secret")
+    user_agent    = credentials.get("user_agent") or DEFAULT_USER_AGENT
 
     if not client_id or not client_secret:
         print("Reddit credentials missing. Set REDDIT_CLIENT_ID and REDDIT_CLIENT_SECRET.")
@@ -329,16 +680,126 @@ def get_problem_category(title: str, selftext: str) -> Tuple[str, str]:
         confidence = "low"
     return best_category, confidence
 
+# ---------- Comment trees ----------
+# Before tree capture only the first 25 top-level comments were kept
+LEGACY_TOP_LEVEL_COMMENTS = 25
+COMMENT_TOP_LEVEL_LIMIT = 25
+COMMENT_MAX_DEPTH = 3         # 0 = top-level only
+COMMENT_MORE_BUDGET = 0       # MoreComments expansions (API calls) allowed per post
+COMMENT_MAX_PER_POST = 100
+
+def _expand_more(stub, adopted: Dict[str, List[Any]]) -> List[Any]:
+    """Fetch one MoreComments stub (one API call) and return the items that replace it.
+
+    morechildren answers with a flat list, so fetched replies to fetched comments
+    are filed under their parent's fullname in `adopted` instead.
+    """
+    fetched = stub.comments()
+    names = {f"t1_{c.id}" for c in fetched if not isinstance(c, MoreComments)}
+    roots = []
+    for item in fetched:
+        parent = getattr(item, "parent_id", None)
+        if parent != stub.parent_id and parent in names:
+            adopted.setdefault(parent, []).append(item)
+        else:
+            roots.append(item)
+    return roots
+
+def capture_comment_tree(post, max_depth: int = COMMENT_MAX_DEPTH, more_budget: int = COMMENT_MORE_BUDGET,
+                         top_level_limit: int = COMMENT_TOP_LEVEL_LIMIT,
+                         max_comments: int = COMMENT_MAX_PER_POST) -> Tuple[List[Tuple[Any, int, bool]], int]:
+    """Walk the tree breadth-first, expanding up to `more_budget` MoreComments on the way.
+
+    A stub is only expanded where its comments would be kept: among the first
+    `top_level_limit` top-level comments, above `max_depth`, and while fewer than
+    `max_comments` are captured or queued. (replace_more() expands the largest
+    stubs first, usually the top-level "load more" one, whose comments the limits
+    then discard.)
+
+    Returns ([(comment, depth, extra)], api_calls) where `extra` marks comments the
+    old top-level-25 capture would have missed and api_calls counts every
+    expansion, including stubs revealed by an earlier one.
+    """
+    adopted: Dict[str, List[Any]] = {}
+    api_calls = 0
+
+    top, pending = [], deque(post.comments)
+    while pending and len(top) < top_level_limit:
+        item = pending.popleft()
+        if not isinstance(item, MoreComments):
+            top.append(item)
+        elif api_calls < more_budget:
+            api_calls += 1
+            pending.extendleft(reversed(_expand_more(item, adopted)))
+
+    captured = []
+    queue = deque((c, 0, i >= LEGACY_TOP_LEVEL_COMMENTS) for i, c in enumerate(top))
+    while queue and len(captured) < max_comments:
+        comment, depth, extra = queue.popleft()
+        captured.append((comment, depth, extra))
+        if depth >= max_depth:
+            continue
+        pending = deque(list(getattr(comment, "replies", [])) + adopted.get(f"t1_{comment.id}", []))
+        while pending:
+            item = pending.popleft()
+            if not isinstance(item, MoreComments):
+                queue.append((item, depth + 1, True))
+            elif api_calls < more_budget and len(captured) + len(queue) < max_comments:
+                api_calls += 1
+                pending.extendleft(reversed(_expand_more(item, adopted)))
+    return captured, api_calls
+
+def store_comment(cur: sqlite3.Cursor, codec: TextCodec, post_id: str, comment, depth: int) -> bool:
+    """Score and upsert one comment; returns True if it is a solution or diagnostic comment."""
+    is_solution, is_diagnostic, has_product_mention, conf_score, c_type = analyze_comment_quality(
+        comment.body or "", int(getattr(comment, "score", 0))
+    )
+    cur.execute("""        INSERT OR REPLACE INTO comments
+        (id, post_id, parent_id, author, body, score, created_utc,
+         is_solution, is_diagnostic, has_product_mention, confidence_score, comment_type, depth)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (
+        comment.id, post_id, getattr(comment, "parent_id", None),
+        str(comment.author) if comment.author else "[deleted]",
+        codec.encode("comment_body", comment.body or ""), int(getattr(comment, "score", 0)),
+        int(getattr(comment, "created_utc", time.time())),
+        is_solution, is_diagnostic, has_product_mention, conf_score, c_type, depth
+    ))
+    return is_solution or is_diagnostic
+
 # ---------- Collect ----------
-def collect_enhanced(subs: List[str], limit: int = 300, incremental: bool = True):
-    """Enhanced collection with comment analysis and incremental support"""
+def collect_enhanced(subs: List[str], limit: int = 300, incremental: bool = True,
+                     comment_depth: int = COMMENT_MAX_DEPTH, more_budget: int = COMMENT_MORE_BUDGET,
+                     top_level_limit: int = COMMENT_TOP_LEVEL_LIMIT, max_comments: int = COMMENT_MAX_PER_POST,
+                     pairs: Optional[List[Tuple[str, str]]] = None, credentials: Optional[Dict[str, str]] = None,
+                     since_utc: Optional[int] = None, known_db: Optional[str] = None,
+                     claims_db: Optional[str] = None):
+    """Enhanced collection with comment analysis and incremental support.
+
+    The remaining arguments are used by sharded collection workers: pairs
+    restricts the search to those (subreddit, term) combinations, since_utc
+    supplies the incremental cutoff instead of reading it from DB_PATH,
+    known_db is the main database (opened read-only) whose posts count as
+    already collected, and claims_db is shared by all shards so each post is
+    fetched by only one of them.
+    """
     init_enhanced_db()
-    reddit = connect_reddit()
-    con = sqlite3.connect(DB_PATH)
+    reddit = connect_reddit(credentials)
+    con = sqlite3.connect(DB_PATH, uri=True)
     cur = con.cursor()
+    codec = load_codec(cur)
+    pair_set = set(pairs) if pairs is not None else None
+    if known_db:
+        cur.execute("ATTACH DATABASE ? AS known", (Path(known_db).resolve().as_uri() + "?mode=ro",))
+        known_post_cols = {r[1] for r in cur.execute("PRAGMA known.table_info(posts)")}
+        copy_cols = ", ".join(r[1] for r in cur.execute("PRAGMA table_info(posts)").fetchall() if r[1] in known_post_cols)
+    claims = sqlite3.connect(claims_db, timeout=30, isolation_level=None) if claims_db else None
 
     last_collection_time = 0
-    if incremental:
+    if incremental and since_utc is not None:
+        last_collection_time = since_utc
+        print(f"{CAL} Incremental mode: collecting posts newer than {datetime.fromtimestamp(last_collection_time)}")
+    elif incremental:
         cur.execute("SELECT MAX(created_utc) FROM posts")
         result = cur.fetchone()
         if result and result[0]:
@@ -349,56 +810,83 @@ def collect_enhanced(subs: List[str], limit: int = 300, incremental: bool = True
             incremental = False
 
     total_posts = total_comments = skipped_posts = updated_posts = 0
+    unchanged_threads = extra_api_calls = extra_useful_comments = other_shard_posts = 0
 
     for sub in subs:
         print(f"{LEAF} {'Incrementally collecting' if incremental else 'Collecting'} from r/{sub} with enhanced analysis...")
         sr = reddit.subreddit(sub)
-        search_terms = ALL_KEYWORDS[:30]
+        search_terms = COLLECT_SEARCH_TERMS
 
         for i, term in enumerate(search_terms, 1):
-            print(f"  {SEARCH} [{i}/30] Searching: '{term}'")
+            if pair_set is not None and (sub, term) not in pair_set:
+                continue
+            print(f"  {SEARCH} [{i}/{len(search_terms)}] Searching: '{term}'")
             try:
                 posts_for_term = 0
                 for post in sr.search(term, sort="relevance", time_filter="all", limit=15):
                     pid = post.id
                     post_created_utc = int(getattr(post, "created_utc", time.time()))
 
-                    if incremental and post_created_utc <= last_collection_time:
+                    cur.execute("SELECT num_comments FROM posts WHERE id=?", (pid,))
+                    stored = cur.fetchone()
+                    staged = stored is not None
+                    if not staged and known_db:
+                        cur.execute("SELECT num_comments FROM known.posts WHERE id=?", (pid,))
+                        stored = cur.fetchone()
+                    post_exists = stored is not None
+
+                    # The cutoff only applies to unseen posts; known ones fall through to the refresh below
+                    if incremental and not post_exists and post_created_utc <= last_collection_time:
                         skipped_posts += 1
                         continue
 
-                    cur.execute("SELECT 1 FROM posts WHERE id=?", (pid,))
-                    post_exists = cur.fetchone() is not None
+                    if not staged and claims is not None and not claims.execute(
+                        "INSERT OR IGNORE INTO shard_claims (post_id) VALUES (?)", (pid,)
+                    ).rowcount:
+                        # Another shard already has this post in this run
+                        other_shard_posts += 1
+                        continue
 
                     if post_exists and incremental:
+                        stored_num_comments = stored[0]
+                        if not staged:
+                            # Known from the main DB only: stage its row so the refresh merges back
+                            cur.execute(f"INSERT INTO posts ({copy_cols}) SELECT {copy_cols} FROM known.posts WHERE id = ?", (pid,))
                         cur.execute(                            """                            UPDATE posts 
                             SET num_comments = ?, score = ?, upvote_ratio = ?, collected_at = ?
                             WHERE id = ?
                             """                        , (                            int(getattr(post, "num_comments", 0)),                            int(getattr(post, "score", 0)),                            float(getattr(post, "upvote_ratio", 0.0)),                            utc_now_iso(),                            pid                        ))
                         updated_posts += 1
 
+                        if int(getattr(post, "num_comments", 0)) == (stored_num_comments or 0):
+                            # Thread unchanged since last collection: skip the comment fetch
+                            unchanged_threads += 1
+                            enqueue_for_analysis(cur, pid)
+                            continue
+
                         try:
                             cur.execute("SELECT id FROM comments WHERE post_id = ?", (pid,))
                             existing_comment_ids = {row[0] for row in cur.fetchall()}
+                            if known_db:
+                                cur.execute("SELECT id FROM known.comments WHERE post_id = ?", (pid,))
+                                existing_comment_ids.update(row[0] for row in cur.fetchall())
 
-                            post.comments.replace_more(limit=0)
+                            captured, api_calls = capture_comment_tree(post, comment_depth, more_budget,
+                                                                       top_level_limit, max_comments)
+                            extra_api_calls += api_calls
                             new_comments = 0
-                            for comment in post.comments[:25]:
+                            for comment, depth, extra in captured:
                                 if comment.id not in existing_comment_ids:
-                                    is_solution, is_diagnostic, has_product_mention, conf_score, c_type = analyze_comment_quality(
-                                        comment.body or "", int(getattr(comment, "score", 0))
-                                    )
-                                    cur.execute(                                        """                                        INSERT OR REPLACE INTO comments
-                                        (id, post_id, parent_id, author, body, score, created_utc,
-                                         is_solution, is_diagnostic, has_product_mention, confidence_score, comment_type)
-                                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                                        """                                    , (                                        comment.id, pid, getattr(comment, "parent_id", None),                                        str(comment.author) if comment.author else "[deleted]",                                        comment.body or "", int(getattr(comment, "score", 0)),                                        int(getattr(comment, "created_utc", time.time())),                                        is_solution, is_diagnostic, has_product_mention, conf_score, c_type                                    ))
+                                    useful = store_comment(cur, codec, pid, comment, depth)
+                                    if extra and useful:
+                                        extra_useful_comments += 1
                                     new_comments += 1
                                     total_comments += 1
                             if new_comments > 0:
                                 print(f"    {PLUS} Added {new_comments} new comments to existing post")
                         except Exception as e:
                             print(f"    Comment update error: {e}")
+                        enqueue_for_analysis(cur, pid)
                         continue
 
                     elif post_exists and not incremental:
@@ -444,19 +932,17 @@ def collect_enhanced(subs: List[str], limit: int = 300, incremental: bool = True
                         """                    , (                        pid, sub, post.title or "", getattr(post, "selftext", "") or "",                        str(post.author) if post.author else "[deleted]",                        post_created_utc,                        url, int(getattr(post, "score", 0)),                        int(getattr(post, "num_comments", 0)),                        image_path, post_hint, float(getattr(post, "upvote_ratio", 0.0)),                        utc_now_iso(),                        problem_category, confidence_level, has_image, float(quality), int(word_count)                    ))
 
                     try:
-                        post.comments.replace_more(limit=0)
-                        for comment in post.comments[:25]:
-                            is_solution, is_diagnostic, has_product_mention, conf_score, c_type = analyze_comment_quality(
-                                comment.body or "", int(getattr(comment, "score", 0))
-                            )
-                            cur.execute(                                """                                INSERT OR REPLACE INTO comments
-                                (id, post_id, parent_id, author, body, score, created_utc,
-                                 is_solution, is_diagnostic, has_product_mention, confidence_score, comment_type)
-                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                                """                            , (                                comment.id, pid, getattr(comment, "parent_id", None),                                str(comment.author) if comment.author else "[deleted]",                                comment.body or "", int(getattr(comment, "score", 0)),                                int(getattr(comment, "created_utc", time.time())),                                is_solution, is_diagnostic, has_product_mention, conf_score, c_type                            ))
+                        captured, api_calls = capture_comment_tree(post, comment_depth, more_budget,
+                                                                   top_level_limit, max_comments)
+                        extra_api_calls += api_calls
+                        for comment, depth, extra in captured:
+                            useful = store_comment(cur, codec, pid, comment, depth)
+                            if extra and useful:
+                                extra_useful_comments += 1
                             total_comments += 1
                     except Exception as e:
                         print(f"    Comment collection error: {e}")
+                    enqueue_for_analysis(cur, pid)
 
                     posts_for_term += 1
                     total_posts += 1
@@ -467,22 +953,265 @@ def collect_enhanced(subs: List[str], limit: int = 300, incremental: bool = True
                     print(f"    {CHECK} Collected {posts_for_term} posts")
 
                 con.commit()
-                time.sleep(1.5)
+                time.sleep(SEARCH_DELAY_SECONDS)
 
             except Exception as e:
                 print(f"  {FAIL} Search error for '{term}': {e}")
                 continue
 
     con.close()
+    if claims is not None:
+        claims.close()
     if incremental:
         print(f"{CHECK} Incremental collection complete:")
         print(f"   {CHART} {total_posts} new posts, {total_comments} new comments")
-        print(f"   {SKIP} {skipped_posts} posts skipped (already collected)")
-        print(f"   {ROTATE} {updated_posts} posts updated with new metadata")
+        print(f"   {SKIP} {skipped_posts} unseen posts skipped (older than the cutoff)")
+        print(f"   {ROTATE} {updated_posts} posts updated with new metadata ({unchanged_threads} threads unchanged, not re-fetched)")
     else:
         print(f"{CHECK} Full collection complete: {total_posts} posts, {total_comments} comments")
+    if claims is not None:
+        print(f"   {SKIP} {other_shard_posts} posts left to the shard that found them first")
+    calls_per_useful = f"{extra_api_calls / extra_useful_comments:.2f}" if extra_useful_comments else "n/a"
+    print(f"   {CHART} Comment trees: {extra_useful_comments} extra useful comments (nested or beyond top "
+          f"{LEGACY_TOP_LEVEL_COMMENTS}) for {extra_api_calls} extra API calls ({calls_per_useful} calls per useful comment)")
+
+# ---------- Sharded collect ----------
+SHARD_DIR = Path("datasets/shards")
+
+def _collect_shard(shard: Dict[str, Any]) -> str:
+    """Worker entry point: collect one shard's (subreddit, term) pairs into its own staging DB."""
+    global DB_PATH
+    DB_PATH = Path(shard["db_path"])
+    prefix = f"[shard {shard['index']}]"
+    print(f"{prefix} {len(shard['pairs'])} (subreddit, term) pairs -> {DB_PATH}")
+    subs = list(dict.fromkeys(sub for sub, _ in shard["pairs"]))
+    collect_enhanced(subs, incremental=shard["since_utc"] is not None, pairs=shard["pairs"],
+                     credentials=shard["credentials"], since_utc=shard["since_utc"],
+                     known_db=shard["known_db"], claims_db=shard["claims_db"], **shard["options"])
+    return str(DB_PATH)
+
+def collect_sharded(subs: List[str], shards: int, incremental: bool = True, keep_shards: bool = False, **options):
+    """Split the (subreddit, term) space across worker processes, one credential set each, then merge."""
+    init_enhanced_db()
+    creds = load_reddit_credentials()
+    if not creds:
+        print("Reddit credentials missing. Set REDDIT_CLIENT_ID/REDDIT_CLIENT_SECRET (and _1, _2, ... for more).")
+        sys.exit(1)
+    shards = max(1, shards)
+    if shards > len(creds):
+        print(f"{SKIP} {shards} shards but only {len(creds)} credential sets; some shards will share a quota")
+
+    since_utc = None
+    if incremental:
+        con = sqlite3.connect(DB_PATH)
+        since_utc = con.execute("SELECT MAX(created_utc) FROM posts").fetchone()[0]
+        con.close()
+
+    pairs = [(sub, term) for sub in subs for term in COLLECT_SEARCH_TERMS]
+    SHARD_DIR.mkdir(parents=True, exist_ok=True)
+    claims_db = SHARD_DIR / "claims.db"
+    claims_db.unlink(missing_ok=True)
+    con = sqlite3.connect(claims_db)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("CREATE TABLE shard_claims (post_id TEXT PRIMARY KEY)")
+    con.close()
+    jobs = []
+    for i in range(shards):
+        db_path = SHARD_DIR / f"shard_{i}.db"
+        if db_path.exists():
+            db_path.unlink()
+        jobs.append({"index": i, "pairs": pairs[i::shards], "credentials": creds[i % len(creds)],
+                     "db_path": str(db_path.resolve()), "since_utc": since_utc, "options": options,
+                     "known_db": str(Path(DB_PATH).resolve()), "claims_db": str(claims_db.resolve())})
+
+    print(f"{LEAF} Sharded collection: {len(pairs)} (subreddit, term) pairs across {shards} workers")
+    with ProcessPoolExecutor(max_workers=shards) as pool:
+        staging = list(pool.map(_collect_shard, jobs))
+
+    merge_shards(staging)
+    if not keep_shards:
+        for path in staging + [str(claims_db)]:
+            Path(path).unlink(missing_ok=True)
+
+def merge_shards(paths: List[str]):
+    """Bulk-upsert staging databases into DB_PATH.
+
+    Posts keep the freshest score/num_comments/upvote_ratio (by collected_at, the
+    shard winning ties); comments take the staged score. Merged posts are
+    (re)queued for analysis. Each shard is merged in its own transaction.
+    """
+    init_enhanced_db()
+    con = sqlite3.connect(DB_PATH, timeout=30)
+    cur = con.cursor()
+    post_cols = [r[1] for r in cur.execute("PRAGMA table_info(posts)")]
+    comment_cols = [r[1] for r in cur.execute("PRAGMA table_info(comments)")]
+
+    for path in paths:
+        if not Path(path).exists():
+            print(f"  {SKIP} Missing shard {path}")
+            continue
+        cur.execute("ATTACH DATABASE ? AS shard", (path,))
+        try:
+            shard_post_cols = {r[1] for r in cur.execute("PRAGMA shard.table_info(posts)")}
+            shard_comment_cols = {r[1] for r in cur.execute("PRAGMA shard.table_info(comments)")}
+            pcols = [c for c in post_cols if c in shard_post_cols]
+            ccols = [c for c in comment_cols if c in shard_comment_cols]
+            before = con.total_changes
+
+            cur.execute(f"""                INSERT INTO posts ({", ".join(pcols)})
+                SELECT {", ".join(pcols)} FROM shard.posts WHERE true
+                ON CONFLICT(id) DO UPDATE SET
+                    score = CASE WHEN excluded.collected_at >= posts.collected_at THEN excluded.score ELSE posts.score END,
+                    num_comments = CASE WHEN excluded.collected_at >= posts.collected_at THEN excluded.num_comments ELSE posts.num_comments END,
+                    upvote_ratio = CASE WHEN excluded.collected_at >= posts.collected_at THEN excluded.upvote_ratio ELSE posts.upvote_ratio END,
+                    collected_at = MAX(posts.collected_at, excluded.collected_at),
+                    image_path = COALESCE(posts.image_path, excluded.image_path),
+                    has_image = MAX(posts.has_image, excluded.has_image)
+            """)
+            post_changes = con.total_changes - before
+
+            cur.execute(f"""                INSERT INTO comments ({", ".join(ccols)})
+                SELECT {", ".join(ccols)} FROM shard.comments WHERE true
+                ON CONFLICT(id) DO UPDATE SET score = excluded.score
+            """)
+            comment_changes = con.total_changes - before - post_changes
+
+            post_ids = [r[0] for r in cur.execute("SELECT id FROM shard.posts").fetchall()]
+            for pid in post_ids:
+                enqueue_for_analysis(cur, pid)
+            con.commit()
+            print(f"  {FLOPPY} Merged {Path(path).name}: {post_changes} posts and {comment_changes} comments upserted")
+        except Exception:
+            # Leave the main DB without any part of this shard
+            con.rollback()
+            raise
+        finally:
+            cur.execute("DETACH DATABASE shard")
+    con.close()
+    print(f"{CHECK} Shard merge complete into {DB_PATH}")
+
+# ---------- Image preprocessing ----------
+IMAGE_DERIVATIVE_SIZE = 768
+IMAGE_THUMBNAIL_SIZE = 256
+IMAGE_WEBP_QUALITY = 80
+IMAGE_WEBP_METHOD = 2               # 0 (fast) - 6 (small); 4+ costs ~2x encode time for a few % size
+# PIL HSV channels are 0-255; hue 255 == 360 degrees
+GREEN_HUE_RANGE = (42, 120)         # ~60-170 degrees
+BROWN_YELLOW_HUE_RANGE = (10, 42)   # ~15-60 degrees
+MIN_SATURATION = 51                 # 20%
+MIN_BRIGHTNESS = 38                 # 15%
+EXIF_ORIENTATION_TAG = 0x0112
+
+def colour_stats(img: Image.Image) -> Dict[str, float]:
+    """Green and brown/yellow pixel ratios plus mean saturation/brightness (0-1) over HSV."""
+    hsv = np.asarray(img.convert("HSV"), dtype=np.uint8)
+    h, sat, val = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    coloured = (sat >= MIN_SATURATION) & (val >= MIN_BRIGHTNESS)
+    green = coloured & (h >= GREEN_HUE_RANGE[0]) & (h < GREEN_HUE_RANGE[1])
+    brown = coloured & (h >= BROWN_YELLOW_HUE_RANGE[0]) & (h < BROWN_YELLOW_HUE_RANGE[1])
+    return {
+        "green_ratio": float(green.mean()),
+        "brown_yellow_ratio": float(brown.mean()),
+        "mean_saturation": float(sat.mean() / 255.0),
+        "mean_brightness": float(val.mean() / 255.0),
+    }
+
+def letterbox(img: Image.Image, size: int) -> Image.Image:
+    """Centre img on a black size x size canvas, downscaling to fit but never enlarging."""
+    fitted = img.copy()
+    fitted.thumbnail((size, size))
+    canvas = Image.new("RGB", (size, size))
+    canvas.paste(fitted, ((size - fitted.width) // 2, (size - fitted.height) // 2))
+    return canvas
+
+def _preprocess_image(task: Dict[str, Any]) -> Dict[str, Any]:
+    """Worker: orient, resize and measure one image. Never raises; errors go in the result."""
+    result = {"post_id": task["post_id"], "source_path": task["source_path"]}
+    try:
+        size, thumb = task["size"], task["thumb_size"]
+        with Image.open(task["source_path"]) as img:
+            # Source dimensions as displayed: taken before draft(), swapped for 90-degree EXIF orientations
+            width, height = img.size
+            if img.getexif().get(EXIF_ORIENTATION_TAG) in (5, 6, 7, 8):
+                width, height = height, width
+            result["width"], result["height"] = width, height
+            # Let the JPEG decoder downscale while decoding; ignored for other formats
+            img.draft("RGB", (size * 2, size * 2))
+            img = ImageOps.exif_transpose(img).convert("RGB")
+
+        # Downscale only (never enlarge); stats are taken before padding so letterbox bars do not count
+        fitted = img.copy()
+        fitted.thumbnail((size, size))
+        result.update(colour_stats(fitted))
+
+        out_dir = Path(task["out_dir"])
+        derivative = out_dir / f"{task['post_id']}.webp"
+        thumbnail = out_dir / f"{task['post_id']}_thumb.webp"
+        # Letterbox onto fixed canvases (ImageOps.pad/fit would upscale small images)
+        letterbox(fitted, size).save(derivative, "WEBP", quality=IMAGE_WEBP_QUALITY, method=IMAGE_WEBP_METHOD)
+        letterbox(fitted, thumb).save(thumbnail, "WEBP", quality=IMAGE_WEBP_QUALITY, method=IMAGE_WEBP_METHOD)
+        result["derivative_path"] = str(derivative)
+        result["thumbnail_path"] = str(thumbnail)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+def preprocess_images(workers: Optional[int] = None, size: int = IMAGE_DERIVATIVE_SIZE,
+                      thumb_size: int = IMAGE_THUMBNAIL_SIZE, force: bool = False) -> int:
+    """Build WebP derivatives/thumbnails and colour features for downloaded post images.
+
+    Images are processed in a process pool; results are written to image_features
+    from this process. Returns the number of images processed.
+    """
+    if np is None:
+        print("Image preprocessing requires numpy (pip install numpy).")
+        sys.exit(1)
+    init_enhanced_db()
+    con = sqlite3.connect(DB_PATH)
+    cur = con.cursor()
+    cur.execute(f"""        SELECT p.id, p.image_path FROM posts p
+        LEFT JOIN image_features f ON f.post_id = p.id
+        WHERE p.image_path IS NOT NULL AND p.image_path != ''
+        {"" if force else "AND f.post_id IS NULL"}
+    """)
+    rows = cur.fetchall()
+    if not rows:
+        print("No new images to preprocess")
+        con.close()
+        return 0
+
+    out_dir = DATA_DIR.parent / f"{DATA_DIR.name}_derived"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tasks = [{"post_id": pid, "source_path": path, "out_dir": str(out_dir), "size": size, "thumb_size": thumb_size}
+             for pid, path in rows]
+
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    print(f"{LEAF} Preprocessing {len(tasks)} images with {workers} workers -> {out_dir}")
+    done = failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for r in pool.map(_preprocess_image, tasks, chunksize=max(1, len(tasks) // (workers * 4))):
+            cur.execute("""                INSERT OR REPLACE INTO image_features
+                (post_id, source_path, derivative_path, thumbnail_path, width, height, green_ratio,
+                 brown_yellow_ratio, mean_saturation, mean_brightness, error, processed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                r["post_id"], r["source_path"], r.get("derivative_path"), r.get("thumbnail_path"),
+                r.get("width"), r.get("height"), r.get("green_ratio"), r.get("brown_yellow_ratio"),
+                r.get("mean_saturation"), r.get("mean_brightness"), r.get("error"), utc_now_iso()
+            ))
+            done += 1
+            if r.get("error"):
+                failed += 1
+                print(f"  {FAIL} {r['post_id']}: {r['error']}")
+            if done % 100 == 0:
+                con.commit()
+                print(f"  {CHECK} {done}/{len(tasks)} images")
+    con.commit()
+    con.close()
+    print(f"{CHECK} Image preprocessing complete: {done - failed} processed, {failed} failed")
+    return done
 
-# ---------- OpenAI ----------
+# ---------- Prompts ----------
 ENHANCED_ANALYSIS_SCHEMA = {
     "type": "object",
     "properties": {
@@ -497,6 +1226,15 @@ ENHANCED_ANALYSIS_SCHEMA = {
     "required": ["root_cause","confidence","categories","solutions","weed_percentage","health_score","treatment_urgency"]
 }
 
+REDDIT_ANALYSIS_SYSTEM_PROMPT = (
+    "You are a Reddit-focused lawn-care intelligence analyst. Identify the likely lawn issue(s) "
+    "discussed, extract actionable solutions from the post and its comments, and prefer claims "
+    "backed by concrete cues (photos, soil tests, rates, timings). If the thread lacks detail, "
+    "say so and mark low confidence.\n\n"
+    "Return a single JSON object matching this schema:\n"
+    + json.dumps(ENHANCED_ANALYSIS_SCHEMA, indent=2)
+)
+
 def build_enhanced_prompt(title: str, body: str, comments: List[str], problem_category: str = "unknown") -> str:
     """Build Reddit analysis prompt using professional system prompt"""
     solution_comments, diagnostic_comments, other_comments = [], [], []
@@ -533,40 +1271,262 @@ def build_enhanced_prompt(title: str, body: str, comments: List[str], problem_ca
     # Use the professional Reddit analysis system prompt
     return f"{REDDIT_ANALYSIS_SYSTEM_PROMPT}\n\nAnalyze this Reddit lawn care discussion:\n\n" + "\n\n".join(parts)
 
-def analyze_enhanced(model: str = "gpt-4o-mini", batch: int = 30, dry_run: bool = False):
-    """Enhanced analysis with comment insights"""
-    init_enhanced_db()
-    if not os.getenv("OPENAI_API_KEY"):
-        print("Set OPENAI_API_KEY in environment or .env")
-        sys.exit(1)
+# ---------- LLM providers ----------
+LOCAL_RULES_MODEL = "local-rules"
+URGENT_CATEGORIES = {"grubs", "chinch_bugs", "brown_patch_disease", "dollar_spot", "fertilizer_burn", "salt_damage"}
+
+class LLMProvider(abc.ABC):
+    """Backend for post analysis and root cause discovery.
+
+    get_provider() keeps one instance per provider name, so the client (and its
+    connection pool) and the max_concurrency bound on in-flight requests are
+    shared by every caller and model of that provider.
+    """
+    name = "base"
+    default_model = ""
+
+    def __init__(self, model: Optional[str] = None, max_concurrency: int = 1):
+        self.model = model or self.default_model
+        self.max_concurrency = max(1, int(max_concurrency))
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+
+    def analyze_post(self, prompt: str, post: Dict[str, Any]) -> Dict[str, Any]:
+        """Return a dict following ENHANCED_ANALYSIS_SCHEMA for one post."""
+        with self._slots:
+            return self._analyze_post(prompt, post)
+
+    def discover_root_causes(self, prompt: str, posts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Return {"discovered_problems": [...]} for a batch of unclassified posts."""
+        with self._slots:
+            return self._discover_root_causes(prompt, posts)
+
+    def with_model(self, model: str) -> "LLMProvider":
+        """Same client and concurrency slots, different model."""
+        clone = copy.copy(self)
+        clone.model = model
+        return clone
+
+    @abc.abstractmethod
+    def _analyze_post(self, prompt: str, post: Dict[str, Any]) -> Dict[str, Any]:
+        ...
+
+    @abc.abstractmethod
+    def _discover_root_causes(self, prompt: str, posts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        ...
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+    default_model = "gpt-4o-mini"
+    ANALYSIS_SYSTEM = "You are an expert lawn care diagnostician. Analyze posts and return structured JSON following the schema."
+    DISCOVERY_SYSTEM = "You are an expert lawn care diagnostician discovering new problem patterns."
+
+    def __init__(self, model: Optional[str] = None, max_concurrency: Optional[int] = None):
+        super().__init__(model, max_concurrency or int(os.getenv("OPENAI_MAX_CONCURRENCY", "4")))
+        if not os.getenv("OPENAI_API_KEY"):
+            raise RuntimeError("Set OPENAI_API_KEY in environment or .env")
+        # Support project-scoped keys seamlessly
+        self.client = OpenAI(
+            project=os.getenv("OPENAI_PROJECT") or None,
+            organization=os.getenv("OPENAI_ORG_ID") or None,
+        )
 
-    # Support project-scoped keys seamlessly
-    client = OpenAI(
-        project=os.getenv("OPENAI_PROJECT") or None,
-        organization=os.getenv("OPENAI_ORG_ID") or None,
-    )
+    def _chat_json(self, system: str, prompt: str, temperature: float) -> Dict[str, Any]:
+        # Using Chat Completions with JSON output (avoids Responses scope issues)
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt}
+            ],
+            response_format={"type": "json_object"},
+            temperature=temperature
+        )
+        result_text = response.choices[0].message.content if response and response.choices else "{}"
+        return json.loads(result_text) if result_text else {}
+
+    def _analyze_post(self, prompt: str, post: Dict[str, Any]) -> Dict[str, Any]:
+        return self._chat_json(self.ANALYSIS_SYSTEM, prompt, 0.3)
+
+    def _discover_root_causes(self, prompt: str, posts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return self._chat_json(self.DISCOVERY_SYSTEM, prompt, 0.4)
+
+class LocalRulesProvider(LLMProvider):
+    """Deterministic CPU-only analysis from the keyword and comment heuristics.
+
+    Meant for first-pass triage: anything it does not rate "high" can be
+    re-run against a paid provider with `analyze --escalate`.
+    """
+    name = "local"
+    default_model = LOCAL_RULES_MODEL
+
+    def __init__(self, model: Optional[str] = None, max_concurrency: Optional[int] = None):
+        super().__init__(model, max_concurrency or 1)
+
+    def _analyze_post(self, prompt: str, post: Dict[str, Any]) -> Dict[str, Any]:
+        category, confidence = get_problem_category(post.get("title", ""), post.get("selftext", ""))
+        if category == "unknown" and post.get("problem_category") not in (None, "", "unknown"):
+            category, confidence = post["problem_category"], "low"
+
+        solutions = []
+        for body in post.get("comments", []):
+            is_solution, _, _, _, _ = analyze_comment_quality(body, 0)
+            if is_solution:
+                solutions.append(body.strip()[:200])
+            if len(solutions) >= 3:
+                break
+
+        label = category.replace("_", " ")
+        return {
+            "root_cause": f"Likely {label} based on keywords in the post." if category != "unknown"
+                          else "Not enough detail in the post to identify a cause.",
+            "confidence": confidence,
+            "categories": [category] if category != "unknown" else [],
+            "solutions": solutions,
+            # Not estimated without an image model; matches the column defaults
+            "weed_percentage": 0.0,
+            "health_score": 5.0,
+            "treatment_urgency": "high" if category in URGENT_CATEGORIES else ("low" if category == "unknown" else "medium"),
+        }
+
+    def _discover_root_causes(self, prompt: str, posts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        # Keyword rules can only recognise known categories
+        return {"discovered_problems": []}
+
+LLM_PROVIDERS = {
+    OpenAIProvider.name: OpenAIProvider,
+    LocalRulesProvider.name: LocalRulesProvider,
+}
+_provider_cache: Dict[str, LLMProvider] = {}
+
+def get_provider(name: str = "openai", model: Optional[str] = None,
+                 max_concurrency: Optional[int] = None) -> LLMProvider:
+    """Return the shared provider for `name`, using `model` if given.
+
+    The client and concurrency limit are per provider: max_concurrency only takes
+    effect when the provider is first created. Raises RuntimeError if it cannot
+    be configured.
+    """
+    if name not in LLM_PROVIDERS:
+        raise RuntimeError(f"Unknown provider '{name}' (choose from: {', '.join(LLM_PROVIDERS)})")
+    if name not in _provider_cache:
+        _provider_cache[name] = LLM_PROVIDERS[name](None, max_concurrency)
+    provider = _provider_cache[name]
+    if max_concurrency and max_concurrency != provider.max_concurrency:
+        print(f"{SKIP} {name} is already limited to {provider.max_concurrency} concurrent requests; ignoring {max_concurrency}")
+    return provider.with_model(model) if model and model != provider.model else provider
+
+# ---------- Analysis ----------
+CONFIDENCE_RANK = {"low": 0, "medium": 1, "high": 2}
+
+# Tiered mode: posts meeting both thresholds get a local (tier-1) analysis instead of a model call
+TIER1_MIN_CATEGORY_CONFIDENCE = "high"
+TIER1_MIN_SOLUTION_COMMENTS = 3
+TIER1_CALIBRATION_FILE = Path("datasets/tier1_calibration.json")
+
+def passes_tier1_gate(confidence_level: Optional[str], solution_count: Optional[int],
+                      min_confidence: str = TIER1_MIN_CATEGORY_CONFIDENCE,
+                      min_solutions: int = TIER1_MIN_SOLUTION_COMMENTS) -> bool:
+    """True when keyword confidence and solution-comment count are strong enough to skip the model."""
+    return (CONFIDENCE_RANK.get(confidence_level or "low", 0) >= CONFIDENCE_RANK[min_confidence]
+            and (solution_count or 0) >= min_solutions)
+
+def _category_key(label: Any) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", safe_str(label).lower()).strip("_")
+
+def compare_tier1(tier1: Dict[str, Any], model_result: Dict[str, Any]) -> Dict[str, bool]:
+    """Agreement between a tier-1 analysis and the model's analysis of the same post."""
+    tier1_cats = {_category_key(c) for c in tier1.get("categories", [])}
+    model_cats = model_result.get("categories", [])
+    model_cats = {_category_key(c) for c in (model_cats if isinstance(model_cats, list) else [model_cats])}
+    root_cause = _category_key(model_result.get("root_cause", ""))
+    return {
+        "category": bool(tier1_cats & model_cats) or any(c and c in root_cause for c in tier1_cats),
+        "confidence": safe_str(tier1.get("confidence")).lower() == safe_str(model_result.get("confidence")).lower(),
+        "urgency": safe_str(tier1.get("treatment_urgency")).lower() == safe_str(model_result.get("treatment_urgency")).lower(),
+    }
 
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
+def write_calibration_report(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Summarize tier-1 vs model agreement, print it and save the details as JSON."""
+    n = len(samples)
+    agreement = {k: (sum(1 for s in samples if s["agreement"][k]) / n if n else 0.0)
+                 for k in ("category", "confidence", "urgency")}
+    print(f"{CHART} Tier-1 calibration on {n} posts: category {agreement['category']:.0%}, "
+          f"confidence {agreement['confidence']:.0%}, urgency {agreement['urgency']:.0%} agreement with model")
+    report = {"timestamp": utc_now_iso(), "samples": n, "agreement": agreement, "posts": samples}
+    with open(TIER1_CALIBRATION_FILE, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"{FLOPPY} Saved calibration details to {TIER1_CALIBRATION_FILE}")
+    return report
+
+def store_analysis(cur: sqlite3.Cursor, codec: TextCodec, post_id: str, model: str, data: Dict[str, Any],
+                   comment_count: int, solution_count: int, diagnostic_count: int):
+    """Coerce a schema-shaped result and upsert it into analyses."""
+    # ---- SAFE COERCION (prevents dict/list binding errors) ----
+    root_cause = data.get("root_cause", "")
+    if not isinstance(root_cause, str):
+        root_cause = safe_str(root_cause)
+
+    confidence = data.get("confidence", "low")
+    if not isinstance(confidence, str):
+        confidence = safe_str(confidence)
+    confidence = confidence.lower()
+    if confidence not in {"high", "medium", "low"}:
+        confidence = "low"
 
-    cur.execute("""        SELECT p.id, p.title, p.selftext, p.problem_category,
-               COUNT(c.id) as comment_count,
-               SUM(CASE WHEN c.is_solution = 1 THEN 1 ELSE 0 END) as solution_comments,
-               SUM(CASE WHEN c.is_diagnostic = 1 THEN 1 ELSE 0 END) as diagnostic_comments
+    categories_json = safe_json_array(data.get("categories", []))
+    solutions_json  = safe_json_array(data.get("solutions", []))
+    weed_pct = float(data.get("weed_percentage", 0.0) or 0.0)
+    health_score = float(data.get("health_score", 5.0) or 5.0)
+    treatment_urgency = data.get("treatment_urgency", "medium")
+    if not isinstance(treatment_urgency, str):
+        treatment_urgency = safe_str(treatment_urgency)
+
+    comment_insights = {
+        "total_comments": int(comment_count or 0),
+        "solution_comments": int(solution_count or 0),
+        "diagnostic_comments": int(diagnostic_count or 0),
+        "community_confidence": "high" if (solution_count or 0) > 2 else ("medium" if (diagnostic_count or 0) > 1 else "low")
+    }
+    reasoning_json = store_reasoning(codec, data, analysis_columns(
+        root_cause, confidence, categories_json, solutions_json,
+        weed_pct, health_score, treatment_urgency
+    ))
+
+    cur.execute("""        INSERT OR REPLACE INTO analyses
+        (post_id, model, root_cause, solutions, confidence, categories, reasoning_json, 
+         analyzed_at, weed_percentage, health_score, treatment_urgency, comment_insights)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (
+        post_id, model, root_cause,
+        solutions_json,
+        confidence,
+        categories_json,
+        reasoning_json,
+        utc_now_iso(),
+        weed_pct,
+        health_score,
+        treatment_urgency,
+        json.dumps(comment_insights, ensure_ascii=False)
+    ))
+
+def load_analysis_jobs(cur: sqlite3.Cursor, codec: TextCodec, post_ids: List[str]) -> List[Dict[str, Any]]:
+    """Build prompt + post payloads for queued posts, in the given order."""
+    if not post_ids:
+        return []
+    marks = ",".join("?" * len(post_ids))
+    cur.execute(f"""        SELECT p.id, p.title, p.selftext, p.problem_category, p.confidence_level,
+               q.comment_count, q.solution_comments, q.diagnostic_comments
         FROM posts p
-        LEFT JOIN comments c ON c.post_id = p.id
-        LEFT JOIN analyses a ON a.post_id = p.id
-        WHERE a.post_id IS NULL
-        GROUP BY p.id, p.title, p.selftext, p.problem_category
-        ORDER BY 
-            (solution_comments + diagnostic_comments) DESC,
-            p.score DESC,
-            comment_count DESC
-        LIMIT 500
-    """)
-    rows = cur.fetchall()
-
-    for i, (post_id, title, selftext, problem_category, comment_count, solution_count, diagnostic_count) in enumerate(rows, 1):
+        JOIN analysis_queue q ON q.post_id = p.id
+        WHERE p.id IN ({marks})
+    """, post_ids)
+    found = {r[0]: r for r in cur.fetchall()}
+
+    jobs = []
+    for post_id in post_ids:
+        if post_id not in found:
+            continue
+        _, title, selftext, problem_category, confidence_level, comment_count, solution_count, diagnostic_count = found[post_id]
         cur.execute("""            SELECT body FROM comments 
             WHERE post_id = ? AND body IS NOT NULL 
             ORDER BY 
@@ -576,98 +1536,164 @@ def analyze_enhanced(model: str = "gpt-4o-mini", batch: int = 30, dry_run: bool
                 score DESC 
             LIMIT 20
         """, (post_id,))
-        comments = [r[0] for r in cur.fetchall()]
-
-        prompt = build_enhanced_prompt(title or "", selftext or "", comments, problem_category or "unknown")
+        comments = [codec.decode(r[0]) for r in cur.fetchall()]
+        jobs.append({
+            "post_id": post_id,
+            "confidence_level": confidence_level,
+            "comment_count": comment_count,
+            "solution_count": solution_count,
+            "diagnostic_count": diagnostic_count,
+            "prompt": build_enhanced_prompt(title or "", selftext or "", comments, problem_category or "unknown"),
+            "post": {"id": post_id, "title": title or "", "selftext": selftext or "",
+                     "problem_category": problem_category or "unknown", "comments": comments},
+        })
+    return jobs
+
+def analyze_enhanced(model: Optional[str] = None, batch: int = 30, dry_run: bool = False,
+                     provider: str = "openai", concurrency: Optional[int] = None, escalate: bool = False,
+                     tiered: bool = False, tier1_confidence: str = TIER1_MIN_CATEGORY_CONFIDENCE,
+                     tier1_min_solutions: int = TIER1_MIN_SOLUTION_COMMENTS, calibrate: int = 0,
+                     limit: int = 500, worker_id: Optional[str] = None,
+                     lease_seconds: int = ANALYSIS_LEASE_SECONDS):
+    """Enhanced analysis with comment insights.
+
+    Work is claimed from analysis_queue in chunks of `batch` posts under a lease,
+    so several analyzer processes can share the backlog; at most `limit` posts
+    are analyzed per run.
+
+    escalate=True first requeues posts whose existing analysis came from the local
+    rules provider with less than high confidence, then claims work as usual (so
+    any other pending posts are analyzed by the provider too).
+
+    tiered=True analyzes posts passing passes_tier1_gate() locally and sends only
+    the rest to the provider; calibrate=N also sends N random tier-1 posts to the
+    provider (results not stored) and writes an agreement report.
+    """
+    init_enhanced_db()
+    llm = None
+    if not dry_run:
+        try:
+            llm = get_provider(provider, model, concurrency)
+        except RuntimeError as e:
+            print(e)
+            sys.exit(1)
 
-        if dry_run:
-            print(f"--- DRY RUN for {post_id} ---")
-            print(f"Category: {problem_category}, Comments: {comment_count} ({solution_count} solutions, {diagnostic_count} diagnostic)")
-            print(prompt[:600] + "...\n")
-            continue
+    con = sqlite3.connect(DB_PATH, timeout=30)
+    cur = con.cursor()
+    codec = load_codec(cur)
 
-        try:
-            # Using Chat Completions with JSON output (avoids Responses scope issues)
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": "You are an expert lawn care diagnostician. Analyze posts and return structured JSON following the schema."},
-                    {"role": "user", "content": prompt}
-                ],
-                response_format={"type": "json_object"},
-                temperature=0.3
-            )
-
-            result_text = response.choices[0].message.content if response and response.choices else "{}"
-            data = json.loads(result_text) if result_text else {}
-
-            # ---- SAFE COERCION (prevents dict/list binding errors) ----
-            root_cause = data.get("root_cause", "")
-            if not isinstance(root_cause, str):
-                root_cause = safe_str(root_cause)
-
-            confidence = data.get("confidence", "low")
-            if not isinstance(confidence, str):
-                confidence = safe_str(confidence)
-            confidence = confidence.lower()
-            if confidence not in {"high", "medium", "low"}:
-                confidence = "low"
-
-            categories_json = safe_json_array(data.get("categories", []))
-            solutions_json  = safe_json_array(data.get("solutions", []))
-            weed_pct = float(data.get("weed_percentage", 0.0) or 0.0)
-            health_score = float(data.get("health_score", 5.0) or 5.0)
-            treatment_urgency = data.get("treatment_urgency", "medium")
-            if not isinstance(treatment_urgency, str):
-                treatment_urgency = safe_str(treatment_urgency)
-
-            comment_insights = {
-                "total_comments": int(comment_count or 0),
-                "solution_comments": int(solution_count or 0),
-                "diagnostic_comments": int(diagnostic_count or 0),
-                "community_confidence": "high" if (solution_count or 0) > 2 else ("medium" if (diagnostic_count or 0) > 1 else "low")
-            }
-            reasoning_json = safe_str(data)
-
-            cur.execute("""                INSERT OR REPLACE INTO analyses
-                (post_id, model, root_cause, solutions, confidence, categories, reasoning_json, 
-                 analyzed_at, weed_percentage, health_score, treatment_urgency, comment_insights)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                post_id, model, root_cause,
-                solutions_json,
-                confidence,
-                categories_json,
-                reasoning_json,
-                utc_now_iso(),
-                weed_pct,
-                health_score,
-                treatment_urgency,
-                json.dumps(comment_insights, ensure_ascii=False)
-            ))
+    if dry_run:
+        cur.execute("SELECT post_id FROM analysis_queue WHERE status = 'pending' ORDER BY priority DESC LIMIT ?", (limit,))
+        for job in load_analysis_jobs(cur, codec, [r[0] for r in cur.fetchall()]):
+            print(f"--- DRY RUN for {job['post_id']} ---")
+            print(f"Category: {job['post']['problem_category']}, Comments: {job['comment_count']} "
+                  f"({job['solution_count']} solutions, {job['diagnostic_count']} diagnostic)")
+            print(job["prompt"][:600] + "...\n")
+        con.close()
+        return
 
-            if i % batch == 0:
+    worker_id = worker_id or default_worker_id()
+    tiered = tiered and not escalate
+    if escalate:
+        requeued = requeue_for_escalation(con, LOCAL_RULES_MODEL, limit)
+        print(f"{ROTATE} Requeued {requeued} {LOCAL_RULES_MODEL} analyses below high confidence for escalation")
+
+    local = get_provider(LocalRulesProvider.name) if tiered else None
+    chunk_size = max(batch, llm.max_concurrency)
+    processed = model_posts = 0
+    tier1_jobs: List[Dict[str, Any]] = []
+    tier1_results: Dict[str, Dict[str, Any]] = {}
+
+    # Provider calls run on worker threads; all SQLite writes stay on this thread
+    with ThreadPoolExecutor(max_workers=llm.max_concurrency) as pool:
+        while processed < limit:
+            n = min(chunk_size, limit - processed)
+            post_ids = claim_analysis_batch(con, worker_id, n, lease_seconds)
+            if not post_ids:
+                break
+
+            model_jobs, chunk_tier1 = [], []
+            for job in load_analysis_jobs(cur, codec, post_ids):
+                if tiered and passes_tier1_gate(job["confidence_level"], job["solution_count"],
+                                                tier1_confidence, tier1_min_solutions):
+                    chunk_tier1.append(job)
+                else:
+                    model_jobs.append(job)
+
+            futures = [pool.submit(llm.analyze_post, job["prompt"], job["post"]) for job in model_jobs]
+            # Tier-1 runs locally while the model calls are in flight; rows are written after them
+            for job in chunk_tier1:
+                tier1_results[job["post_id"]] = local.analyze_post(job["prompt"], job["post"])
+            results = []
+            for job, future in zip(model_jobs, futures):
+                try:
+                    results.append((job, llm.model, future.result()))
+                except Exception as e:
+                    import traceback
+                    traceback.print_exc()
+                    print(f"Analysis failed for {job['post_id']}: {e}")
+                    results.append((job, llm.model, None))
+            results += [(job, local.model, tier1_results[job["post_id"]]) for job in chunk_tier1]
+            tier1_jobs.extend(chunk_tier1)
+
+            # Every result is in hand before the first write, so the write lock is held
+            # for this one short transaction rather than while model calls are awaited
+            try:
+                for job, result_model, data in results:
+                    if data is not None:
+                        try:
+                            store_analysis(cur, codec, job["post_id"], result_model, data,
+                                           job["comment_count"], job["solution_count"], job["diagnostic_count"])
+                            complete_analysis(cur, job["post_id"])
+                            continue
+                        except sqlite3.Error:
+                            raise
+                        except Exception as e:
+                            print(f"Analysis failed for {job['post_id']}: {e}")
+                    release_analysis(cur, job["post_id"])
                 con.commit()
-                print(f"{BRAIN} Analyzed {i}/{len(rows)} (Comments: {comment_count}, Solutions: {solution_count})")
-
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
-            print(f"Analysis failed for {post_id}: {e}")
-            continue
+            except sqlite3.Error as e:
+                con.rollback()
+                print(f"{FAIL} Could not save {len(results)} analyses: {e} (their leases expire back to the queue)")
+
+            processed += len(post_ids)
+            model_posts += len(model_jobs)
+            print(f"{BRAIN} Analyzed {processed} posts ({len(model_jobs)} of the last {len(post_ids)} via {llm.model})")
+
+        calibration_jobs = random.sample(tier1_jobs, min(calibrate, len(tier1_jobs))) if calibrate > 0 else []
+        calibration_futures = [pool.submit(llm.analyze_post, job["prompt"], job["post"]) for job in calibration_jobs]
+        calibration = []
+        for job, future in zip(calibration_jobs, calibration_futures):
+            try:
+                model_result = future.result()
+            except Exception as e:
+                print(f"Calibration call failed for {job['post_id']}: {e}")
+                continue
+            tier1 = tier1_results[job["post_id"]]
+            calibration.append({"post_id": job["post_id"], "tier1": tier1, "model": model_result,
+                                "agreement": compare_tier1(tier1, model_result)})
 
     con.commit()
     con.close()
+    if tiered:
+        total = len(tier1_jobs) + model_posts
+        avoided = len(tier1_jobs) / total if total else 0.0
+        print(f"{CHART} Tiered analysis: {len(tier1_jobs)}/{total} posts analyzed locally, "
+              f"{avoided:.0%} of model calls avoided" + (f" (+{len(calibration_jobs)} calibration calls)" if calibration_jobs else ""))
+        if calibration_jobs:
+            write_calibration_report(calibration)
     print(f"{CHECK} Enhanced analysis complete with comment insights.")
 
 # ---------- Discovery ----------
-def discover_new_root_causes(model: str = "gpt-4o-mini", dry_run: bool = False):
-    """Discover new root causes from unclassified posts"""
+def discover_new_root_causes(model: Optional[str] = None, dry_run: bool = False, provider: str = "openai") -> int:
+    """Discover new root causes from unclassified posts; returns the number of posts sent for discovery"""
+    init_enhanced_db()
     con = sqlite3.connect(DB_PATH)
     cur = con.cursor()
+    codec = load_codec(cur)
 
-    cur.execute("""        SELECT p.id, p.title, p.selftext, p.problem_category, a.confidence,
-               GROUP_CONCAT(c.body, ' | ') as comments
+    # Comment bodies may be compressed, so they are joined in Python rather than GROUP_CONCAT
+    cur.execute("""        SELECT p.id, p.title, p.selftext, p.problem_category, a.confidence
         FROM posts p
         LEFT JOIN analyses a ON a.post_id = p.id
         LEFT JOIN comments c ON c.post_id = p.id AND c.is_solution = 1
@@ -683,7 +1709,7 @@ def discover_new_root_causes(model: str = "gpt-4o-mini", dry_run: bool = False):
     if not rows:
         print("No unclassified posts found for root cause discovery")
         con.close()
-        return
+        return 0
 
     discovery_prompt = """Analyze these lawn care posts that couldn't be classified into existing categories.
 Identify potential NEW root causes not covered by existing categories.
@@ -694,7 +1720,12 @@ compacted soil, thatch buildup, moss invasion, broadleaf weeds, grassy weeds, cr
 
 Posts to analyze:
 """
-    for i, (post_id, title, selftext, category, confidence, comments) in enumerate(rows[:20]):
+    prompt_posts = []
+    for i, (post_id, title, selftext, category, confidence) in enumerate(rows[:20]):
+        cur.execute("SELECT body FROM comments WHERE post_id = ? AND is_solution = 1", (post_id,))
+        comments = " | ".join(codec.decode(r[0]) or "" for r in cur.fetchall())
+        prompt_posts.append({"id": post_id, "title": title or "", "selftext": selftext or "",
+                             "problem_category": category or "unknown", "solutions": comments})
         discovery_prompt += f"\n{i+1}. Title: {title}\nDescription: {safe_str(selftext)[:200]}...\nSolutions: {safe_str(comments)[:300] if comments else 'None'}...\n"
 
     discovery_prompt += """Return JSON like:
@@ -718,28 +1749,17 @@ Posts to analyze:
         print(f"Would analyze {len(rows)} unclassified posts")
         print(discovery_prompt[:600] + "...")
         con.close()
-        return
+        return 0
 
     try:
-        if not os.getenv("OPENAI_API_KEY"):
-            print("OpenAI API key required for root cause discovery")
+        try:
+            llm = get_provider(provider, model)
+        except RuntimeError as e:
+            print(f"Root cause discovery unavailable: {e}")
             con.close()
-            return
+            return 0
 
-        client = OpenAI(
-            project=os.getenv("OPENAI_PROJECT") or None,
-            organization=os.getenv("OPENAI_ORG_ID") or None,
-        )
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "You are an expert lawn care diagnostician discovering new problem patterns."},
-                {"role": "user", "content": discovery_prompt}
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.4
-        )
-        result = json.loads(response.choices[0].message.content or "{}")
+        result = llm.discover_root_causes(discovery_prompt, prompt_posts)
         discovered = result.get("discovered_problems", [])
 
         if discovered:
@@ -763,6 +1783,7 @@ Posts to analyze:
         print(f"Root cause discovery failed: {e}")
 
     con.close()
+    return len(prompt_posts)
 
 # ---------- Export ----------
 def export_enhanced_csv():
@@ -799,6 +1820,141 @@ def export_enhanced_csv():
     con.close()
     print(f"{OUTBOX} Enhanced export complete: {out}")
 
+# ---------- Storage migration ----------
+REASONING_SELECT = ("reasoning_json, root_cause, confidence, categories, solutions, "
+                    "weed_percentage, health_score, treatment_urgency")
+
+def _storage_snapshot(con: sqlite3.Connection, codec: TextCodec) -> Dict[str, float]:
+    """Sizes of the compressible columns / DB file and a full-decode read throughput."""
+    cur = con.cursor()
+    page_count = cur.execute("PRAGMA page_count").fetchone()[0]
+    page_size = cur.execute("PRAGMA page_size").fetchone()[0]
+    body_bytes = cur.execute("SELECT COALESCE(SUM(LENGTH(CAST(body AS BLOB))), 0) FROM comments").fetchone()[0]
+    reasoning_bytes = cur.execute(
+        "SELECT COALESCE(SUM(LENGTH(CAST(reasoning_json AS BLOB))), 0) FROM analyses"
+    ).fetchone()[0]
+
+    rows = 0
+    start = time.perf_counter()
+    for (body,) in cur.execute("SELECT body FROM comments"):
+        codec.decode(body)
+        rows += 1
+    for r in cur.execute(f"SELECT {REASONING_SELECT} FROM analyses"):
+        load_reasoning(codec, r[0], analysis_columns(*r[1:]))
+        rows += 1
+    elapsed = time.perf_counter() - start
+
+    return {
+        "file_bytes": page_count * page_size,
+        "body_bytes": body_bytes,
+        "reasoning_bytes": reasoning_bytes,
+        "read_rows_per_sec": rows / elapsed if elapsed > 0 else 0.0,
+    }
+
+def _rewrite_in_chunks(con: sqlite3.Connection, table: str, column: str, select: str,
+                       transform, chunk_size: int) -> int:
+    """Rewrite `column` for every row of `table`, committing every `chunk_size` rows."""
+    cur = con.cursor()
+    last_rowid = rewritten = 0
+    while True:
+        cur.execute(f"SELECT rowid, {select} FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last_rowid, chunk_size))
+        rows = cur.fetchall()
+        if not rows:
+            break
+        cur.executemany(f"UPDATE {table} SET {column} = ? WHERE rowid = ?",
+                        [(transform(r[1:]), r[0]) for r in rows])
+        con.commit()
+        last_rowid = rows[-1][0]
+        rewritten += len(rows)
+        print(f"  {ROTATE} {table}.{column}: {rewritten} rows rewritten")
+    return rewritten
+
+def _reencode_reasoning(codec: TextCodec, row: Tuple) -> Any:
+    columns = analysis_columns(*row[1:])
+    plain = load_reasoning(codec, row[0], columns)
+    try:
+        data = json.loads(plain)
+    except ValueError:
+        return codec.encode("reasoning_json", plain)
+    return store_reasoning(codec, data, columns)
+
+def _training_samples(cur: sqlite3.Cursor, codec: TextCodec, kind: str, sample_size: int) -> List[bytes]:
+    samples = []
+    if kind == "comment_body":
+        cur.execute("SELECT body FROM comments WHERE body IS NOT NULL AND body != '' ORDER BY RANDOM() LIMIT ?",
+                    (sample_size,))
+        for (body,) in cur.fetchall():
+            samples.append(codec.decode(body).encode("utf-8"))
+    else:
+        cur.execute(f"SELECT {REASONING_SELECT} FROM analyses WHERE reasoning_json IS NOT NULL "
+                    "ORDER BY RANDOM() LIMIT ?", (sample_size,))
+        for r in cur.fetchall():
+            columns = analysis_columns(*r[1:])
+            plain = load_reasoning(codec, r[0], columns)
+            try:
+                plain = safe_str(compact_reasoning(json.loads(plain), columns))
+            except ValueError:
+                pass
+            samples.append(plain.encode("utf-8"))
+    return [s for s in samples if s]
+
+def migrate_compressed_storage(chunk_size: int = 2000, sample_size: int = 5000,
+                               dict_size: int = 64 * 1024, decompress: bool = False) -> Dict[str, Any]:
+    """Train zstd dictionaries and rewrite comment bodies / reasoning_json in chunks.
+
+    With decompress=True every row is rewritten back to plain TEXT and the
+    dictionaries are dropped. Run while collect/analyze are not writing.
+    """
+    init_enhanced_db()
+    if zstd is None:
+        print("Compressed storage requires zstandard (pip install zstandard).")
+        sys.exit(1)
+
+    con = sqlite3.connect(DB_PATH)
+    cur = con.cursor()
+    codec = load_codec(cur)
+    before = _storage_snapshot(con, codec)
+
+    if decompress:
+        cur.execute("UPDATE compression_dicts SET active = 0")
+    else:
+        for kind in COMPRESSED_KINDS:
+            samples = _training_samples(cur, codec, kind, sample_size)
+            try:
+                zdict = zstd.train_dictionary(dict_size, samples)
+            except zstd.ZstdError as e:
+                print(f"  {SKIP} Not enough {kind} samples to train a dictionary ({len(samples)} rows): {e}")
+                continue
+            cur.execute("UPDATE compression_dicts SET active = 0 WHERE kind = ?", (kind,))
+            cur.execute("""                INSERT OR REPLACE INTO compression_dicts (dict_id, kind, dict_data, trained_at, active)
+                VALUES (?, ?, ?, ?, 1)
+            """, (zdict.dict_id(), kind, zdict.as_bytes(), utc_now_iso()))
+            print(f"  {CHECK} Trained {kind} dictionary {zdict.dict_id()} from {len(samples)} samples")
+    con.commit()
+    codec = load_codec(cur)
+
+    _rewrite_in_chunks(con, "comments", "body", "body",
+                       lambda r: codec.encode("comment_body", codec.decode(r[0])), chunk_size)
+    _rewrite_in_chunks(con, "analyses", "reasoning_json", REASONING_SELECT,
+                       lambda r: _reencode_reasoning(codec, r), chunk_size)
+
+    # Every row now uses an active dictionary (or none), so retired ones can go
+    cur.execute("DELETE FROM compression_dicts WHERE active = 0")
+    con.commit()
+    con.execute("VACUUM")
+    codec = load_codec(cur)
+    after = _storage_snapshot(con, codec)
+    con.close()
+
+    print(f"{CHART} Storage {'decompression' if decompress else 'compression'} report:")
+    for label, key in (("DB file", "file_bytes"), ("comments.body", "body_bytes"),
+                       ("analyses.reasoning_json", "reasoning_bytes")):
+        ratio = (after[key] / before[key]) if before[key] else 1.0
+        print(f"   {label:<24} {before[key] / 1024:>10.1f} KB -> {after[key] / 1024:>10.1f} KB ({ratio:.0%})")
+    print(f"   {'read throughput':<24} {before['read_rows_per_sec']:>10.0f} rows/s -> {after['read_rows_per_sec']:>10.0f} rows/s")
+    return {"before": before, "after": after}
+
 # ---------- CLI ----------
 def main():
     load_dotenv()
@@ -809,22 +1965,82 @@ def main():
     p_collect.add_argument("--subs", nargs="+", default=["lawncare","landscaping","plantclinic"])
     p_collect.add_argument("--limit", type=int, default=300)
     p_collect.add_argument("--full", action="store_true", help="Disable incremental mode and collect everything again")
+    p_collect.add_argument("--comment-depth", type=int, default=COMMENT_MAX_DEPTH, help="Reply depth to capture (0 = top-level only)")
+    p_collect.add_argument("--more-budget", type=int, default=COMMENT_MORE_BUDGET,
+                           help="MoreComments expansions (API calls) allowed per post within the depth/top-level limits")
+    p_collect.add_argument("--top-level", type=int, default=COMMENT_TOP_LEVEL_LIMIT, help="Top-level comments to keep per post")
+    p_collect.add_argument("--max-comments", type=int, default=COMMENT_MAX_PER_POST, help="Comments stored per post")
+    p_collect.add_argument("--shards", type=int, default=0,
+                           help="Collect with N worker processes (one Reddit credential set each) and merge")
+    p_collect.add_argument("--keep-shards", action="store_true", help="Keep staging shard databases after merging")
+
+    p_merge = sub.add_parser("merge-shards", help="Merge staging shard databases into the main database")
+    p_merge.add_argument("paths", nargs="+")
 
     p_analyze = sub.add_parser("analyze", help="Enhanced AI analysis with comment insights")
-    p_analyze.add_argument("--model", type=str, default="gpt-4o-mini")
+    p_analyze.add_argument("--provider", choices=sorted(LLM_PROVIDERS), default="openai")
+    p_analyze.add_argument("--model", type=str, default=None, help="Model name (defaults to the provider's)")
+    p_analyze.add_argument("--concurrency", type=int, default=None, help="Max in-flight requests for the provider")
+    p_analyze.add_argument("--escalate", action="store_true",
+                           help=f"Re-analyze posts that {LOCAL_RULES_MODEL} rated below high confidence")
     p_analyze.add_argument("--dry-run", action="store_true")
-    p_analyze.add_argument("--batch", type=int, default=30, help="Commit/log every N analyses")
+    p_analyze.add_argument("--batch", type=int, default=30, help="Posts claimed from the queue (and written) per chunk")
+    p_analyze.add_argument("--tiered", action="store_true",
+                           help="Analyze posts with strong keyword and comment signals locally; send only the rest to the model")
+    p_analyze.add_argument("--tier1-confidence", choices=["high", "medium"], default=TIER1_MIN_CATEGORY_CONFIDENCE,
+                           help="Minimum keyword-category confidence for tier-1")
+    p_analyze.add_argument("--tier1-min-solutions", type=int, default=TIER1_MIN_SOLUTION_COMMENTS,
+                           help="Minimum solution comments for tier-1")
+    p_analyze.add_argument("--calibrate", type=int, default=0,
+                           help="Also send N random tier-1 posts to the model and report agreement")
+    p_analyze.add_argument("--limit", type=int, default=500, help="Maximum posts to analyze in this run")
+    p_analyze.add_argument("--worker-id", type=str, default=None, help="Lease owner name (default host:pid)")
+    p_analyze.add_argument("--lease-seconds", type=int, default=ANALYSIS_LEASE_SECONDS,
+                           help="How long claimed posts stay reserved for this worker")
+
+    sub.add_parser("queue", help="Show analysis queue status")
 
     sub.add_parser("export", help="Export enhanced results to CSV")
 
+    p_images = sub.add_parser("preprocess-images", help="Build WebP derivatives, thumbnails and colour features for images")
+    p_images.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    p_images.add_argument("--size", type=int, default=IMAGE_DERIVATIVE_SIZE, help="Derivative edge length in pixels")
+    p_images.add_argument("--thumb-size", type=int, default=IMAGE_THUMBNAIL_SIZE, help="Thumbnail edge length in pixels")
+    p_images.add_argument("--force", action="store_true", help="Reprocess images that already have features")
+
+    p_compress = sub.add_parser("compress", help="Migrate comment bodies and raw model JSON to zstd dictionary storage")
+    p_compress.add_argument("--chunk-size", type=int, default=2000, help="Rows rewritten per commit")
+    p_compress.add_argument("--sample-size", type=int, default=5000, help="Rows sampled to train each dictionary")
+    p_compress.add_argument("--dict-size", type=int, default=64 * 1024, help="Dictionary size in bytes")
+    p_compress.add_argument("--decompress", action="store_true", help="Rewrite everything back to plain TEXT")
+
     args = parser.parse_args()
 
     if args.cmd == "collect":
-        collect_enhanced(args.subs, args.limit, incremental=(not args.full))
+        tree_options = dict(comment_depth=args.comment_depth, more_budget=args.more_budget,
+                            top_level_limit=args.top_level, max_comments=args.max_comments)
+        if args.shards > 0:
+            collect_sharded(args.subs, args.shards, incremental=(not args.full),
+                            keep_shards=args.keep_shards, **tree_options)
+        else:
+            collect_enhanced(args.subs, args.limit, incremental=(not args.full), **tree_options)
+    elif args.cmd == "merge-shards":
+        merge_shards(args.paths)
     elif args.cmd == "analyze":
-        analyze_enhanced(model=args.model, dry_run=args.dry_run, batch=args.batch)
+        analyze_enhanced(model=args.model, dry_run=args.dry_run, batch=args.batch,
+                         provider=args.provider, concurrency=args.concurrency, escalate=args.escalate,
+                         tiered=args.tiered, tier1_confidence=args.tier1_confidence,
+                         tier1_min_solutions=args.tier1_min_solutions, calibrate=args.calibrate,
+                         limit=args.limit, worker_id=args.worker_id, lease_seconds=args.lease_seconds)
+    elif args.cmd == "queue":
+        print_queue_status()
     elif args.cmd == "export":
         export_enhanced_csv()
+    elif args.cmd == "preprocess-images":
+        preprocess_images(workers=args.workers, size=args.size, thumb_size=args.thumb_size, force=args.force)
+    elif args.cmd == "compress":
+        migrate_compressed_storage(chunk_size=args.chunk_size, sample_size=args.sample_size,
+                                   dict_size=args.dict_size, decompress=args.decompress)
     else:
         parser.print_help()
 
@@ -0,0 +1,589 @@
+"""
+pipeline_benchmark.py
+Offline, reproducible benchmark for enhanced_lawn_reddit_pipeline.
+Generates a synthetic Reddit corpus from TARGET_KEYWORDS, serves it through a
+fake PRAW-compatible client, answers OpenAI calls from a local stub server and
+times each pipeline stage (rows/sec + peak RSS; per stage on Linux, where the
+high-water mark can be reset, cumulative for the process elsewhere).
+
+Usage:
+    python pipeline_benchmark.py --posts 600 --latency-ms 25
+    python pipeline_benchmark.py --json-out bench.json --compress
+    python pipeline_benchmark.py --baseline bench.json --tolerance 0.2
+"""
+import argparse, contextlib, io, json, math, os, random, shutil, sys, tempfile, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Callable
+
+from PIL import Image
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# collect_enhanced keeps at most 10 posts per search term
+POSTS_PER_TERM = 10
+
+FILLER_SENTENCES = [
+    "I mow every week at about three inches.",
+    "We had a lot of rain last month and then a heat wave.",
+    "The lawn is mostly tall fescue with some bluegrass.",
+    "I put down a spring fertilizer application in April.",
+    "The area gets full sun most of the afternoon.",
+    "Neighbors' lawns look fine so I'm not sure what is going on.",
+    "I water early in the morning twice a week.",
+    "Pictures attached, any help appreciated.",
+]
+POST_SIGNALS = [
+    "Turned out to be something else last year.",
+    "Soil test showed low potassium.",
+    "Fixed it by overseeding, this worked.",
+    "Tried this product and it didn't work.",
+]
+COMMENT_TEMPLATES = [
+    "Looks like {kw} to me, classic signs of it. Probably caused by the heat.",
+    "I had this same problem last summer. What worked for me was a treatment in early fall, try this.",
+    "This is likely {kw}. The symptoms match and it's probably due to watering at night.",
+    "I recommend a product from the store, it works well and is effective against {kw}.",
+    "Fixed mine with core aeration and overseeding. Success after about six weeks.",
+    "Hard to tell from the photo.",
+    "Same here, following this thread because my lawn has {kw} too and nothing has helped so far this year.",
+]
+
+# ---------- Synthetic corpus ----------
+def _paragraph(rng: random.Random, keywords: List[str], signal_rate: float) -> str:
+    sentences = rng.sample(FILLER_SENTENCES, k=3)
+    for kw in keywords:
+        sentences.insert(rng.randrange(len(sentences) + 1), f"I think it might be {kw}.")
+    if rng.random() < signal_rate:
+        sentences.append(rng.choice(POST_SIGNALS))
+    return " ".join(sentences)
+
+def generate_corpus(target_keywords: Dict[str, List[str]], search_terms: List[str],
+                    posts: int = 600, max_comments: int = 30, image_ratio: float = 0.3,
+                    reply_ratio: float = 0.3, seed: int = 1234) -> Dict[str, Any]:
+    """Build a deterministic synthetic corpus of posts, comments and image flags.
+
+    Every post carries one search term in its title and FakeReddit indexes it under
+    that term only; subreddits are sized so no (subreddit, term) pair exceeds what
+    collect keeps, so every generated post is ingested.
+    """
+    rng = random.Random(seed)
+    categories = list(target_keywords.keys())
+    n_subs = max(1, math.ceil(posts / (len(search_terms) * POSTS_PER_TERM)))
+    subreddits = [f"benchlawn{i}" for i in range(n_subs)]
+    base_time = 1_600_000_000
+
+    records: List[Dict[str, Any]] = []
+    comment_seq = 0
+    for i in range(posts):
+        term = search_terms[i % len(search_terms)]
+        sub = subreddits[(i // len(search_terms)) % n_subs]
+        category = rng.choice(categories)
+        keywords = rng.sample(target_keywords[category], k=min(2, len(target_keywords[category])))
+        pid = f"b{i:07x}"
+
+        comments: List[Dict[str, Any]] = []
+        for _ in range(rng.randint(0, max_comments)):
+            comment_seq += 1
+            parent = None
+            if comments and rng.random() < reply_ratio:
+                parent = rng.choice(comments)
+            comments.append({
+                "id": f"c{comment_seq:08x}",
+                "parent": parent["id"] if parent else None,
+                "body": rng.choice(COMMENT_TEMPLATES).format(kw=rng.choice(keywords)),
+                "score": rng.randint(-2, 60),
+                "created_utc": base_time + i * 60 + len(comments),
+                "author": f"commenter{rng.randrange(500)}",
+            })
+
+        records.append({
+            "id": pid,
+            "subreddit": sub,
+            "term": term,
+            "title": f"Help with {term}? {keywords[0]} spreading",
+            "selftext": _paragraph(rng, keywords, signal_rate=0.4),
+            "author": f"user{rng.randrange(2000)}",
+            "created_utc": base_time + i * 60,
+            "score": rng.randint(0, 120),
+            "num_comments": len(comments),
+            "upvote_ratio": round(rng.uniform(0.5, 1.0), 2),
+            "has_image": rng.random() < image_ratio,
+            "category": category,
+            "comments": comments,
+        })
+
+    return {"subreddits": subreddits, "posts": records}
+
+# ---------- Fake PRAW ----------
+class FakeAuthor:
+    def __init__(self, name: str):
+        self.name = name
+
+    def __str__(self) -> str:
+        return self.name
+
+class FakeComment:
+    def __init__(self, data: Dict[str, Any], post_id: str):
+        self.id = data["id"]
+        self.body = data["body"]
+        self.score = data["score"]
+        self.created_utc = data["created_utc"]
+        self.author = FakeAuthor(data["author"])
+        self.parent_id = f"t1_{data['parent']}" if data["parent"] else f"t3_{post_id}"
+        self.replies = FakeCommentForest([])
+
+class FakeCommentForest(list):
+    """List of top-level comments with the bits of praw's CommentForest the pipeline uses."""
+    def replace_more(self, limit: Optional[int] = 32, threshold: int = 0) -> list:
+        return []
+
+    def list(self) -> List[FakeComment]:
+        out, queue = [], list(self)
+        while queue:
+            c = queue.pop(0)
+            out.append(c)
+            queue.extend(c.replies)
+        return out
+
+class FakeSubmission:
+    def __init__(self, data: Dict[str, Any], image_base_url: str):
+        self.id = data["id"]
+        self.title = data["title"]
+        self.selftext = data["selftext"]
+        self.author = FakeAuthor(data["author"])
+        self.created_utc = data["created_utc"]
+        self.score = data["score"]
+        self.num_comments = data["num_comments"]
+        self.upvote_ratio = data["upvote_ratio"]
+        if data["has_image"]:
+            self.post_hint = "image"
+            self.url = f"{image_base_url}/images/{self.id}.jpg"
+        else:
+            self.post_hint = "self"
+            self.url = f"https://www.reddit.com/r/{data['subreddit']}/comments/{self.id}/"
+        self._comment_data = data["comments"]
+
+    @property
+    def comments(self) -> FakeCommentForest:
+        by_id = {c["id"]: FakeComment(c, self.id) for c in self._comment_data}
+        roots = []
+        for c in self._comment_data:
+            node = by_id[c["id"]]
+            if c["parent"]:
+                by_id[c["parent"]].replies.append(node)
+            else:
+                roots.append(node)
+        return FakeCommentForest(roots)
+
+class FakeSubreddit:
+    def __init__(self, name: str, index: Dict[str, List[FakeSubmission]]):
+        self.display_name = name
+        self._index = index
+
+    def search(self, query: str, sort: str = "relevance", time_filter: str = "all", limit: Optional[int] = 100):
+        hits = self._index.get(query.lower(), [])
+        return iter(hits[:limit] if limit else hits)
+
+class FakeReddit:
+    """PRAW-compatible stand-in serving a synthetic corpus.
+
+    Each post is indexed under the term it was generated for (not every term its
+    text happens to contain), so per-term hit lists stay within collect's cap.
+    """
+    def __init__(self, corpus: Dict[str, Any], image_base_url: str):
+        self._subs: Dict[str, Dict[str, List[FakeSubmission]]] = {s: {} for s in corpus["subreddits"]}
+        for data in corpus["posts"]:
+            index = self._subs[data["subreddit"]]
+            index.setdefault(data["term"].lower(), []).append(FakeSubmission(data, image_base_url))
+
+    def subreddit(self, name: str) -> FakeSubreddit:
+        return FakeSubreddit(name, self._subs.get(name, {}))
+
+# ---------- Stub OpenAI + image server ----------
+def _analysis_payload(rng: random.Random, categories: List[str]) -> Dict[str, Any]:
+    category = rng.choice(categories)
+    return {
+        "root_cause": f"Most likely {category.replace('_', ' ')} based on the described symptoms.",
+        "confidence": rng.choices(["high", "medium", "low"], weights=[4, 3, 3])[0],
+        "categories": [category],
+        "solutions": ["Adjust watering schedule", "Overseed thin areas in early fall"],
+        "weed_percentage": round(rng.uniform(0, 60), 1),
+        "health_score": round(rng.uniform(2, 9), 1),
+        "treatment_urgency": rng.choice(["low", "medium", "high"]),
+    }
+
+def _discovery_payload(rng: random.Random) -> Dict[str, Any]:
+    return {"discovered_problems": [{
+        "name": "Synthetic shade stress",
+        "description": "Thin turf under tree canopy",
+        "confidence": round(rng.uniform(0.5, 0.9), 2),
+        "supporting_posts": rng.randint(2, 8),
+        "example_descriptions": ["grass thinning under maple"],
+        "suggested_treatments": ["Overseed with fine fescue"],
+        "suggested_products": ["Shade seed mix"],
+    }]}
+
+class StubServer:
+    """Local HTTP server answering /v1/chat/completions and serving /images/*.jpg."""
+    def __init__(self, categories: List[str], latency_ms: float = 0.0, seed: int = 1234):
+        self.categories = categories
+        self.latency = latency_ms / 1000.0
+        self.seed = seed
+        self.requests = 0
+        self._lock = threading.Lock()
+        buf = io.BytesIO()
+        Image.new("RGB", (640, 480), (70, 130, 40)).save(buf, format="JPEG", quality=85)
+        self.image_bytes = buf.getvalue()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, fmt, *args):
+                pass
+
+            def _send(self, status: int, body: bytes, ctype: str):
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.startswith("/images/"):
+                    self._send(200, stub.image_bytes, "image/jpeg")
+                else:
+                    self._send(404, b"{}", "application/json")
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.endswith("/chat/completions"):
+                    self._send(404, b"{}", "application/json")
+                    return
+                with stub._lock:
+                    stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                prompt = "\n".join(m.get("content") or "" for m in request.get("messages", []))
+                rng = random.Random(f"{stub.seed}:{prompt}")
+                if "discovered_problems" in prompt:
+                    payload = _discovery_payload(rng)
+                else:
+                    payload = _analysis_payload(rng, stub.categories)
+                body = json.dumps({
+                    "id": "chatcmpl-bench",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "bench"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": json.dumps(payload)},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": 80,
+                              "total_tokens": len(prompt) // 4 + 80},
+                }).encode("utf-8")
+                self._send(200, body, "application/json")
+
+        return Handler
+
+# ---------- Measurement ----------
+def reset_peak_rss() -> bool:
+    """Reset the kernel's RSS high-water mark (Linux only); False if peaks stay cumulative."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss_mb() -> Optional[float]:
+    """High-water RSS in MB since the last reset_peak_rss() (or process start where that is
+    unsupported); None when the platform exposes neither /proc, resource nor psutil."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS, kilobytes elsewhere
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    return None
+
+def children_peak_rss_mb() -> Optional[float]:
+    """Largest RSS of any terminated child process in MB (None where resource is unavailable)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_stage(name: str, fn: Callable[[], int], stub: StubServer, verbose: bool = False,
+              uses_workers: bool = False) -> Dict[str, Any]:
+    """Run one stage, returning rows processed, wall time, rows/sec, model calls and peak RSS.
+
+    peak_rss_scope is "stage" when the high-water mark could be reset first and
+    "process" when the value includes every earlier stage. Either way it covers
+    this process only; stages that fan out to worker processes also report
+    worker_peak_rss_mb, the largest child seen so far.
+    """
+    calls_before = stub.requests
+    per_stage = reset_peak_rss()
+    sink = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    start = time.perf_counter()
+    with sink:
+        rows = fn()
+    elapsed = time.perf_counter() - start
+    result = {
+        "stage": name,
+        "rows": rows,
+        "seconds": round(elapsed, 4),
+        "rows_per_sec": round(rows / elapsed, 1) if elapsed > 0 else 0.0,
+        "model_calls": stub.requests - calls_before,
+        "peak_rss_mb": None if peak_rss_mb() is None else round(peak_rss_mb(), 1),
+        "peak_rss_scope": "stage" if per_stage else "process",
+    }
+    if uses_workers:
+        worker_peak = children_peak_rss_mb()
+        result["worker_peak_rss_mb"] = None if worker_peak is None else round(worker_peak, 1)
+    return result
+
+def _count(pipeline, sql: str) -> int:
+    con = pipeline.sqlite3.connect(pipeline.DB_PATH)
+    try:
+        return int(con.execute(sql).fetchone()[0] or 0)
+    finally:
+        con.close()
+
+def _import_pipeline():
+    try:
+        from . import enhanced_lawn_reddit_pipeline as pipeline
+    except ImportError:
+        import enhanced_lawn_reddit_pipeline as pipeline
+    return pipeline
+
+# ---------- Benchmark ----------
+def run_benchmark(posts: int = 600, max_comments: int = 30, image_ratio: float = 0.3,
+                  latency_ms: float = 25.0, seed: int = 1234, workdir: Optional[str] = None,
+                  keep: bool = False, verbose: bool = False, compress: bool = False,
+                  provider: str = "openai", tiered: bool = False) -> Dict[str, Any]:
+    """Run every pipeline stage against a synthetic corpus in an isolated working directory.
+
+    With compress=True the zstd storage migration runs after analysis, so
+    discovery and export read compressed rows. provider="local" runs analysis
+    and discovery on the rules-based provider instead of the stub server;
+    tiered=True runs analysis in confidence-gated two-tier mode.
+    """
+    owns_workdir = workdir is None
+    work = Path(workdir or tempfile.mkdtemp(prefix="lawn_bench_")).resolve()
+    work.mkdir(parents=True, exist_ok=True)
+    prev_cwd = os.getcwd()
+    prev_env = {k: os.environ.get(k) for k in ("OPENAI_API_KEY", "OPENAI_BASE_URL", "OPENAI_PROJECT", "OPENAI_ORG_ID")}
+    os.chdir(work)
+    stub = None
+    try:
+        # Import after chdir so the module's datasets/ directories land in the workdir
+        pipeline = _import_pipeline()
+        pipeline.DB_PATH = work / "datasets" / "reddit_lawn_data.db"
+        pipeline.DATA_DIR = work / "datasets" / "reddit_lawns"
+        pipeline.DATA_DIR.mkdir(parents=True, exist_ok=True)
+        pipeline.SEARCH_DELAY_SECONDS = 0
+
+        search_terms = pipeline.COLLECT_SEARCH_TERMS
+        corpus = generate_corpus(pipeline.TARGET_KEYWORDS, search_terms, posts=posts,
+                                 max_comments=max_comments, image_ratio=image_ratio, seed=seed)
+        stub = StubServer(list(pipeline.TARGET_KEYWORDS.keys()), latency_ms=latency_ms, seed=seed).start()
+        reddit = FakeReddit(corpus, stub.base_url)
+        pipeline.connect_reddit = lambda credentials=None: reddit
+
+        os.environ["OPENAI_API_KEY"] = "bench-key"
+        os.environ["OPENAI_BASE_URL"] = f"{stub.base_url}/v1"
+        os.environ.pop("OPENAI_PROJECT", None)
+        os.environ.pop("OPENAI_ORG_ID", None)
+
+        def collect() -> int:
+            pipeline.collect_enhanced(corpus["subreddits"], incremental=False)
+            return _count(pipeline, "SELECT COUNT(*) FROM posts") + _count(pipeline, "SELECT COUNT(*) FROM comments")
+
+        def images() -> int:
+            return pipeline.preprocess_images()
+
+        def heuristics() -> int:
+            rows = 0
+            for p in corpus["posts"]:
+                pipeline.analyze_text_quality(p["title"], p["selftext"], p["num_comments"], p["score"])
+                pipeline.get_problem_category(p["title"], p["selftext"])
+                rows += 1
+                for c in p["comments"]:
+                    pipeline.analyze_comment_quality(c["body"], c["score"])
+                    rows += 1
+            return rows
+
+        model = "bench-model" if provider == "openai" else None
+
+        def analyze() -> int:
+            pipeline.analyze_enhanced(model=model, provider=provider, tiered=tiered)
+            return _count(pipeline, "SELECT COUNT(*) FROM analyses")
+
+        def compress_storage() -> int:
+            pipeline.migrate_compressed_storage()
+            return _count(pipeline, "SELECT COUNT(*) FROM comments") + _count(pipeline, "SELECT COUNT(*) FROM analyses")
+
+        def discover() -> int:
+            return pipeline.discover_new_root_causes(model=model, provider=provider)
+
+        def export() -> int:
+            pipeline.export_enhanced_csv()
+            with open(work / "datasets" / "enhanced_lawn_analyses.csv", encoding="utf-8") as f:
+                return max(sum(1 for _ in f) - 1, 0)
+
+        stages = [
+            run_stage("collect", collect, stub, verbose),
+        ]
+        ingested_posts = _count(pipeline, "SELECT COUNT(*) FROM posts")
+        ingested_comments = _count(pipeline, "SELECT COUNT(*) FROM comments")
+        notes = []
+        if pipeline.np is None:
+            notes.append("images stage skipped: preprocess_images needs numpy")
+        else:
+            stages.append(run_stage("images", images, stub, verbose, uses_workers=True))
+        stages += [
+            run_stage("heuristics", heuristics, stub, verbose),
+            run_stage("analysis", analyze, stub, verbose),
+        ]
+        if compress:
+            stages.append(run_stage("compress", compress_storage, stub, verbose))
+        stages += [
+            run_stage("discovery", discover, stub, verbose),
+            run_stage("export", export, stub, verbose),
+        ]
+        return {
+            "config": {"posts": posts, "max_comments": max_comments, "image_ratio": image_ratio,
+                       "latency_ms": latency_ms, "seed": seed, "compress": compress, "provider": provider, "tiered": tiered,
+                       "subreddits": len(corpus["subreddits"]),
+                       "corpus_comments": sum(len(p["comments"]) for p in corpus["posts"]),
+                       "ingested_posts": ingested_posts, "ingested_comments": ingested_comments},
+            "stages": stages,
+            "notes": notes,
+            "db_bytes": pipeline.DB_PATH.stat().st_size if pipeline.DB_PATH.exists() else 0,
+            "workdir": str(work),
+        }
+    finally:
+        if stub is not None:
+            stub.stop()
+        os.chdir(prev_cwd)
+        for k, v in prev_env.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+        if owns_workdir and not keep:
+            shutil.rmtree(work, ignore_errors=True)
+
+def compare_to_baseline(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Return a message for every stage whose rows/sec fell more than `tolerance` below baseline."""
+    previous = {s["stage"]: s for s in baseline.get("stages", [])}
+    regressions = []
+    for stage in result["stages"]:
+        old = previous.get(stage["stage"])
+        if not old or not old.get("rows_per_sec"):
+            continue
+        floor = old["rows_per_sec"] * (1.0 - tolerance)
+        if stage["rows_per_sec"] < floor:
+            regressions.append(
+                f"{stage['stage']}: {stage['rows_per_sec']} rows/s < {old['rows_per_sec']} rows/s baseline (-{tolerance:.0%} allowed)"
+            )
+    return regressions
+
+def print_report(result: Dict[str, Any]):
+    cfg = result["config"]
+    print(f"Synthetic corpus: {cfg['posts']} posts, {cfg['corpus_comments']} comments, "
+          f"{cfg['subreddits']} subreddits, stub latency {cfg['latency_ms']} ms")
+    print(f"Ingested by collect: {cfg['ingested_posts']} posts, {cfg['ingested_comments']} comments")
+    cumulative = any(s["peak_rss_scope"] == "process" for s in result["stages"])
+    rss_label = "cum. RSS MB" if cumulative else "peak RSS MB"
+    print(f"{'stage':<12}{'rows':>10}{'seconds':>12}{'rows/sec':>12}{'calls':>8}{rss_label:>14}")
+    for s in result["stages"]:
+        rss = "n/a" if s["peak_rss_mb"] is None else f"{s['peak_rss_mb']:.1f}"
+        print(f"{s['stage']:<12}{s['rows']:>10}{s['seconds']:>12.3f}{s['rows_per_sec']:>12.1f}{s['model_calls']:>8}{rss:>14}")
+    if cumulative:
+        print("Peak RSS is the process high-water mark, so each stage includes earlier stages.")
+    for s in result["stages"]:
+        if "worker_peak_rss_mb" in s:
+            worker = "n/a" if s["worker_peak_rss_mb"] is None else f"{s['worker_peak_rss_mb']:.1f} MB"
+            print(f"{s['stage']}: RSS above is the parent only; largest worker process peaked at {worker}")
+    for note in result.get("notes", []):
+        print(f"Note: {note}")
+    print(f"DB size: {result['db_bytes'] / 1024:.1f} KB")
+
+# ---------- CLI ----------
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark for the enhanced lawn Reddit pipeline")
+    parser.add_argument("--posts", type=int, default=600, help="Number of synthetic posts")
+    parser.add_argument("--max-comments", type=int, default=30, help="Maximum comments per post")
+    parser.add_argument("--image-ratio", type=float, default=0.3, help="Fraction of posts with an image")
+    parser.add_argument("--latency-ms", type=float, default=25.0, help="Stub OpenAI response latency")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--workdir", type=str, default=None, help="Run in this directory instead of a temp dir")
+    parser.add_argument("--keep", action="store_true", help="Keep the temp working directory")
+    parser.add_argument("--verbose", action="store_true", help="Show pipeline output")
+    parser.add_argument("--compress", action="store_true", help="Run the zstd storage migration after analysis")
+    parser.add_argument("--provider", type=str, default="openai", help="LLM provider for analysis/discovery")
+    parser.add_argument("--tiered", action="store_true", help="Run analysis in two-tier mode")
+    parser.add_argument("--json-out", type=str, default=None, help="Write results as JSON")
+    parser.add_argument("--baseline", type=str, default=None, help="Compare rows/sec against a previous --json-out")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed rows/sec drop vs baseline")
+    args = parser.parse_args()
+
+    result = run_benchmark(posts=args.posts, max_comments=args.max_comments, image_ratio=args.image_ratio,
+                           latency_ms=args.latency_ms, seed=args.seed, workdir=args.workdir,
+                           keep=args.keep, verbose=args.verbose, compress=args.compress,
+                           provider=args.provider, tiered=args.tiered)
+    print_report(result)
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_to_baseline(result, json.load(f), args.tolerance)
+        if regressions:
+            print("Regressions detected:")
+            for r in regressions:
+                print(f"  {r}")
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+if __name__ == "__main__":
+    main()